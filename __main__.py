@@ -1,49 +1,39 @@
-from tqdm import tqdm
+import os
 from random_agent import RandomAgent
 from decision_tree.decision_tree_agent import DecisionTreeAgent
-from game import Game
-
-
-agents =       []
-
-tournament_stats = [{'spy_wins':0, 'spy_games':0, 'resistance_wins':0, 'resistance_games':0} for _ in range(len(agents))]
-
-
-def print_results():
-        print('--------RESULTS----------')
-        for a in range(len(agents)):
-                s = str(agents[a]) + ':\n'
-                if tournament_stats[a]["spy_games"]:
-                        s += f'SPY WIN RATE = {tournament_stats[a]["spy_wins"] / tournament_stats[a]["spy_games"]} | ' 
-                if tournament_stats[a]["resistance_games"]:
-                        s += f'RESISTANCE WIN RATE = {tournament_stats[a]["resistance_wins"] / tournament_stats[a]["resistance_games"]} | ' 
-                s += f'OVERALL WIN RATE = {(tournament_stats[a]["resistance_wins"] + tournament_stats[a]["spy_wins"]) / total_rounds}'
-                s += '\n' + '-' * 100
-                print(s)
-
-
-total_rounds = 2000
-
-for i in tqdm(range(total_rounds)):
-        game = Game(agents)
-        game.play()
-        agents = game.agents
-        spies = game.spies
-        resistance = [i for i in range(len(agents)) if i not in spies]
-        spies_won = False
-        if game.missions_lost >= 3:
-                spies_won = True
-        for a in range(len(agents)):
-                if a in spies:
-                        tournament_stats[a]['spy_games'] += 1 
-                if a in resistance:
-                        tournament_stats[a]['resistance_games'] += 1
-                if a in spies and spies_won:
-                        tournament_stats[a]['spy_wins'] += 1 
-                if a in resistance and not spies_won:
-                        tournament_stats[a]['resistance_wins'] += 1 
-
-print_results()
-
-
-
+from tournament import play_tournament, print_results
+from profiler import Profiler
+
+
+def make_agents():
+        '''
+        Returns the roster of agents for the tournament.
+        With num_workers > 1 this is called once in every worker process.
+        '''
+        return []
+
+
+#most games played, enough for any roster to reach target_width
+total_rounds = 10000
+#stop once every win rate is known to within this width (95% interval), None to play every game.
+#an agent is a spy in a third to two fifths of its games, so 0.05 takes at most about 4600 games
+target_width = 0.05
+#games are sharded over this many processes, 1 plays every game in this process
+num_workers = os.cpu_count()
+#results are identical for the same master_seed, whatever the number of workers
+master_seed = 0
+#directory to record every game into (see recorder.py), None to not record games
+record_dir = None
+#file to write the time agents take in each callback to (see profiler.py), None to not profile games
+profile_path = None
+
+if __name__ == '__main__':
+        agents = make_agents()
+        profiler = None if profile_path is None else Profiler()
+        tournament_stats = play_tournament(make_agents, total_rounds, master_seed, num_workers, record_dir=record_dir,
+                                           target_width=target_width, profiler=profiler)
+        rounds_played = tournament_stats[0]['spy_games'] + tournament_stats[0]['resistance_games']
+        print_results(agents, tournament_stats, rounds_played)
+        if profiler is not None:
+                profiler.print_report()
+                profiler.export(profile_path)
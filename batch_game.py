@@ -0,0 +1,206 @@
+'''
+A NumPy engine that plays many games of The Resistance in lockstep.
+Instead of calling every agent once per game, each seat of the roster is played by a
+BatchPolicy that makes its decision for every game in the batch at once.
+This only suits policies that do not need the history of their own game, such as random
+or fixed rule players, but measures their win rates over millions of games in seconds.
+'''
+
+from abc import ABC, abstractmethod
+from agent import Agent
+from online_stats import new_stats, merge_stats
+import numpy as np
+
+
+class BatchPolicy(ABC):
+    '''
+    An abstract super class for a policy playing one member of the roster in a BatchGame.
+    A subclass must override propose_mission, vote and betray, or it cannot be instantiated.
+    Every method is given arrays with one row per game that needs a decision from this policy
+    and returns one decision per row.
+    seats is the seat of this policy in each of those games,
+    spies is a boolean (games, num_players) array which is True for the seats of the spies.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return 'Agent ' + self.name
+
+    def __repr__(self):
+        return self.__str__()
+
+    @abstractmethod
+    def propose_mission(self, rng, team_size, fails_required, seats, spies):
+        '''
+        returns a boolean (games, num_players) array with team_size seats set in each row,
+        the teams proposed by this policy in games where it is the leader.
+        rng is the numpy Generator of the batch.
+        '''
+
+    @abstractmethod
+    def vote(self, rng, teams, leaders, seats, spies):
+        '''
+        teams is a boolean (games, num_players) array of the proposed teams,
+        and leaders is the seat of the proposer in each game.
+        returns a boolean array which is True where this policy votes for the mission.
+        '''
+
+    @abstractmethod
+    def betray(self, rng, teams, leaders, seats, spies):
+        '''
+        only called for games where this policy is a spy on an approved team.
+        returns a boolean array which is True where this policy betrays the mission.
+        '''
+
+
+class RandomBatchPolicy(BatchPolicy):
+    '''
+    The batch equivalent of RandomAgent.
+    '''
+
+    def __init__(self, name='Rando', vote_rate=0.5, betray_rate=0.3):
+        self.name = name
+        self.vote_rate = vote_rate
+        self.betray_rate = betray_rate
+
+    def propose_mission(self, rng, team_size, fails_required, seats, spies):
+        #RandomAgent draws its team from range(team_size), so it always proposes the first team_size seats
+        teams = np.zeros(spies.shape, dtype=bool)
+        teams[:, :team_size] = True
+        return teams
+
+    def vote(self, rng, teams, leaders, seats, spies):
+        return rng.random(len(seats)) < self.vote_rate
+
+    def betray(self, rng, teams, leaders, seats, spies):
+        return rng.random(len(seats)) < self.betray_rate
+
+
+class BatchGame:
+    '''
+    Plays num_games games between the policies in lockstep.
+    The state of all games is kept in arrays indexed by game and seat:
+    - seating maps each seat to the index of its policy in the roster
+    - spies is True for the seats of the spies
+    - leader is the seat of the next leader
+    - fails is the number of betrayals on each round's mission (-1 if no team was approved)
+    - num_proposals is the number of teams proposed in each round
+    '''
+
+    def __init__(self, policies, num_games, rng=None):
+        '''
+        policies is the roster of 5-10 BatchPolicy objects,
+        rng is a numpy Generator, or a seed for one.
+        Like Game, this shuffles the seating and assigns spies at random in every game.
+        '''
+        if len(policies)<5 or len(policies)>10:
+            raise Exception('Agent array out of range')
+        self.policies = policies
+        self.num_players = len(policies)
+        self.num_games = num_games
+        self.rng = np.random.default_rng(rng)
+
+        n = self.num_players
+        self.seating = self.rng.permuted(np.tile(np.arange(n), (num_games, 1)), axis=1)
+        self.seat_of = np.argsort(self.seating, axis=1)
+        spy_seats = np.argsort(self.rng.random((num_games, n)), axis=1)[:, :Agent.spy_count[n]]
+        self.spies = np.zeros((num_games, n), dtype=bool)
+        np.put_along_axis(self.spies, spy_seats, True, axis=1)
+
+        self.leader = np.zeros(num_games, dtype=np.int64)
+        self.missions_lost = np.zeros(num_games, dtype=np.int64)
+        self.fails = np.full((num_games, 5), -1, dtype=np.int8)
+        self.num_proposals = np.zeros((num_games, 5), dtype=np.int8)
+
+    def play(self):
+        '''
+        plays all five rounds of every game
+        '''
+        for rnd in range(5):
+            self.play_round(rnd)
+
+    def play_round(self, rnd):
+        '''
+        proposes teams until one is approved or five are rejected, in every game,
+        and records the number of betrayals on the approved mission
+        '''
+        n = self.num_players
+        team_size = Agent.mission_sizes[n][rnd]
+        fails_required = Agent.fails_required[n][rnd]
+        succeeded = np.zeros(self.num_games, dtype=bool)
+        decided = np.zeros(self.num_games, dtype=bool)
+
+        for _ in range(5):
+            games = np.flatnonzero(~decided)
+            if games.size == 0:
+                break
+            leaders = self.leader[games]
+            spies = self.spies[games]
+            seating = self.seating[games]
+            seat_of = self.seat_of[games]
+
+            teams = np.zeros((games.size, n), dtype=bool)
+            leader_policy = seating[np.arange(games.size), leaders]
+            for p, policy in enumerate(self.policies):
+                sel = np.flatnonzero(leader_policy == p)
+                if sel.size:
+                    teams[sel] = policy.propose_mission(self.rng, team_size, fails_required, leaders[sel], spies[sel])
+
+            votes = np.zeros((games.size, n), dtype=bool)
+            for p, policy in enumerate(self.policies):
+                seats = seat_of[:, p]
+                votes[np.arange(games.size), seats] = policy.vote(self.rng, teams, leaders, seats, spies)
+
+            self.leader[games] = (leaders + 1) % n
+            self.num_proposals[games, rnd] += 1
+            approved = np.flatnonzero(2 * votes.sum(axis=1) > n)
+
+            fails = np.zeros(approved.size, dtype=np.int64)
+            for p, policy in enumerate(self.policies):
+                seats = seat_of[approved, p]
+                sel = np.flatnonzero(teams[approved, seats] & spies[approved, seats])
+                if sel.size:
+                    g = approved[sel]
+                    fails[sel] += policy.betray(self.rng, teams[g], leaders[g], seats[sel], spies[g])
+
+            self.fails[games[approved], rnd] = fails
+            succeeded[games[approved]] = fails < fails_required
+            decided[games[approved]] = True
+
+        self.missions_lost += ~succeeded
+
+    def spies_won(self):
+        '''
+        returns a boolean array which is True for the games the spies won
+        '''
+        return self.missions_lost >= 3
+
+    def stats(self):
+        '''
+        returns the tournament_stats of the batch, one dictionary per policy in the roster
+        '''
+        spies_won = self.spies_won()
+        stats = new_stats(self.num_players)
+        for p in range(self.num_players):
+            is_spy = self.spies[np.arange(self.num_games), self.seat_of[:, p]]
+            stats[p]['spy_games'] = int(is_spy.sum())
+            stats[p]['spy_wins'] = int((is_spy & spies_won).sum())
+            stats[p]['resistance_games'] = int((~is_spy).sum())
+            stats[p]['resistance_wins'] = int((~is_spy & ~spies_won).sum())
+        return stats
+
+
+def play_batch_tournament(policies, total_rounds, seed=None, batch_size=100000):
+    '''
+    plays total_rounds games between the policies in batches of batch_size games
+    and returns the tournament_stats, in the same format as tournament.play_tournament
+    '''
+    rng = np.random.default_rng(seed)
+    stats = new_stats(len(policies))
+    for start in range(0, total_rounds, batch_size):
+        game = BatchGame(policies, min(batch_size, total_rounds - start), rng)
+        game.play()
+        merge_stats(stats, game.stats())
+    return stats
@@ -0,0 +1,231 @@
+'''
+Measures the throughput of the game engine, the ISMCTS agents and the decision tree agent,
+and writes the results as a JSON report, so changes in performance can be tracked between commits.
+Run from the repository root as
+    python benchmark.py [report.json] [seconds]
+where seconds is roughly how long each measurement runs (1 by default).
+The report has the time, commit and machine it was made on, and for each benchmark its rate in operations per second:
+- game: games per second of Game between RandomAgents, for each number of players
+- search: for high_bf, high_bf_array_tree and low_bf, ResistanceState get_moves, make_move and playout per second,
+  and the ISMCTS iterations of a search of MAX_TIME seconds (0.35), for each number of players
+- decision_tree: Tree.traverse_tree and compiled Tree.evaluate calls per second on states from played games
+'''
+
+from agent import Agent
+from random_agent import RandomAgent
+from tournament import play_game
+from mcts import monte_high_bf, monte_low_bf
+from decision_tree.decision_tree_agent import DecisionTreeAgent
+from time import perf_counter
+import copy
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+
+PLAYER_COUNTS = range(5, 11)
+#number of states in the pools get_moves, make_move and playout are measured on
+NUM_STATES = 2000
+
+
+def measure(run, min_time):
+    '''
+    calls run() until min_time seconds have passed, where run does some operations and returns how many,
+    and returns the operations per second
+    '''
+    ops = 0
+    start = perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        ops += run()
+        elapsed = perf_counter() - start
+    return ops / elapsed
+
+
+def bench_games(min_time):
+    '''
+    returns {number of players: games per second} of games between RandomAgents
+    '''
+    results = {}
+    for num_players in PLAYER_COUNTS:
+        roster = [RandomAgent(name=str(i)) for i in range(num_players)]
+        seeds = random.Random(num_players)
+        def run():
+            play_game(roster, seeds.getrandbits(32))
+            return 1
+        results[num_players] = measure(run, min_time)
+    return results
+
+
+def random_walk_states(module, num_players, num_states, rng):
+    '''
+    returns num_states (state, move) pairs met on random walks through games of the module's ResistanceState,
+    each starting from the first team selection of a random determination, where move is one of the state's moves
+    '''
+    pairs = []
+    while len(pairs) < num_states:
+        spies = rng.sample(range(num_players), Agent.spy_count[num_players])
+        state = module.ResistanceState(num_players, module.to_mask(spies), 0, 0, module.StateNames.SELECTION, 0, 0)
+        moves = state.get_moves()
+        while moves and len(pairs) < num_states:
+            move = rng.choice(moves)
+            pairs.append((copy.copy(state), move))
+            state.make_move(move)
+            moves = state.get_moves()
+    return pairs
+
+
+def bench_ops(module, num_players, min_time, rng):
+    '''
+    returns {'get_moves', 'make_move', 'playout'} operations per second of the module's ResistanceState
+    '''
+    pairs = random_walk_states(module, num_players, NUM_STATES, rng)
+    states = [state for state, _ in pairs]
+    results = {}
+
+    def run():
+        for state in states:
+            state.get_moves()
+        return len(states)
+    results['get_moves'] = measure(run, min_time)
+
+    #make_move and playout change their states, so they are timed on copies made outside the timed loop
+    ops = elapsed = 0
+    while elapsed < min_time:
+        copies = [(copy.copy(state), move) for state, move in pairs]
+        start = perf_counter()
+        for state, move in copies:
+            state.make_move(move)
+        elapsed += perf_counter() - start
+        ops += len(copies)
+    results['make_move'] = ops / elapsed
+
+    ops = elapsed = 0
+    while elapsed < min_time:
+        copies = [copy.copy(state) for state in states]
+        start = perf_counter()
+        for state in copies:
+            state.playout(rng)
+        elapsed += perf_counter() - start
+        ops += len(copies)
+    results['playout'] = ops / elapsed
+    return results
+
+
+def bench_ismcts(make_agent, num_players, num_searches, seed):
+    '''
+    returns the median number of ISMCTS iterations of num_searches first team selections by a resistance agent
+    '''
+    iterations = []
+    for i in range(num_searches):
+        agent = make_agent()
+        agent.set_rng(random.Random(seed + i))
+        agent.new_game(num_players, 0, [])
+        agent.propose_mission(Agent.mission_sizes[num_players][0])
+        iterations.append(agent.iterations)
+    return statistics.median(iterations)
+
+
+def bench_search(min_time):
+    '''
+    returns {module: {number of players: {'get_moves', 'make_move', 'playout', 'ismcts_iterations'}}}
+    '''
+    #a search takes MAX_TIME seconds, so at least three are run for each count of players
+    num_searches = max(3, round(min_time / monte_high_bf.MAX_TIME))
+    agents = {
+        'high_bf': lambda: monte_high_bf.Monte('high'),
+        'high_bf_array_tree': lambda: monte_high_bf.Monte('high', use_array_tree=True),
+        'low_bf': lambda: monte_low_bf.Monte('low'),
+    }
+    modules = {'high_bf': monte_high_bf, 'high_bf_array_tree': monte_high_bf, 'low_bf': monte_low_bf}
+    results = {}
+    for name, make_agent in agents.items():
+        results[name] = {}
+        for num_players in PLAYER_COUNTS:
+            rng = random.Random(num_players)
+            #the array tree shares its ResistanceState with the object tree, so only its search is measured
+            results[name][num_players] = {} if name == 'high_bf_array_tree' else bench_ops(modules[name], num_players, min_time, rng)
+            results[name][num_players]['ismcts_iterations'] = bench_ismcts(make_agent, num_players, num_searches, num_players)
+    return results
+
+
+class StateCollector(DecisionTreeAgent):
+    '''
+    a DecisionTreeAgent that keeps a copy of its game state at every vote
+    '''
+
+    def __init__(self, name, states):
+        super().__init__(name)
+        self.collected = states
+
+    def vote(self, mission, proposer):
+        result = super().vote(mission, proposer)
+        self.collected.append(copy.deepcopy(self.states))
+        return result
+
+
+def bench_decision_tree(min_time):
+    '''
+    returns {'traverse_tree', 'evaluate'} decisions per second of the pretrained trees of DecisionTreeAgent,
+    on the states seen by a DecisionTreeAgent in games against RandomAgents
+    '''
+    states = []
+    roster = [StateCollector('collector', states)] + [RandomAgent(name=str(i)) for i in range(6)]
+    seeds = random.Random(0)
+    while len(states) < NUM_STATES:
+        play_game(roster, seeds.getrandbits(32))
+    agent = roster[0]
+    tree = agent.tree
+
+    def run_traverse():
+        for state in states:
+            for t in agent.thistree:
+                tree.traverse_tree(t, state)
+        return len(states) * len(agent.thistree)
+
+    def run_evaluate():
+        for state in states:
+            for compiled in agent.compiled:
+                tree.evaluate(compiled, state)
+        return len(states) * len(agent.compiled)
+
+    return {'traverse_tree': measure(run_traverse, min_time), 'evaluate': measure(run_evaluate, min_time)}
+
+
+def git_commit():
+    '''
+    returns the hash of the checked out commit, or None outside a git repository
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(min_time=1.0):
+    '''
+    runs every benchmark, each measurement for about min_time seconds, and returns the report
+    '''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'min_time': min_time,
+        'game': bench_games(min_time),
+        'search': bench_search(min_time),
+        'decision_tree': bench_decision_tree(min_time),
+    }
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'benchmark.json'
+    min_time = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    report = run_benchmarks(min_time)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
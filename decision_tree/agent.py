@@ -1,3 +1,6 @@
+import random
+
+
 class Agent:
     '''An abstract super class for an agent in the game The Resistance.
     new_game and *_outcome methods simply inform agents of events that have occured,
@@ -26,6 +29,9 @@ class Agent:
             9:[1,1,1,2,1], \
             10:[1,1,1,2,1]
             }
+    #random number generator the agent should draw from instead of the random module.
+    #the game replaces it with a seeded random.Random through set_rng before each game.
+    rng = random
 
     def __init__(self, name):
         '''
@@ -49,6 +55,14 @@ class Agent:
         '''
         return self.__str__()
 
+    def set_rng(self, rng):
+        '''
+        gives the agent a random.Random instance to use for the next game.
+        It is called before new_game, and each agent in a game gets its own generator
+        seeded from the game's generator, so a game can be replayed from its seed.
+        '''
+        self.rng = rng
+
     def new_game(self, number_of_players, player_number, spies):
         '''
         initialises the game, informing the agent of the number_of_players, 
@@ -0,0 +1,59 @@
+import gzip
+import json
+import os
+
+
+class Checkpoint():
+    '''
+    Saves the progress of a training run (train.py) to a gzipped JSON file, so an interrupted run
+    can resume from its last saved generation instead of starting over.
+    Each level of the run (generate_end_tree, check_converge, train) keeps its loop variables
+    in a section of its own, and the state of the run's random number generator is saved with them.
+    Since every random choice of the run is drawn from that generator, a resumed run makes the same
+    choices as one that was never interrupted.
+    '''
+    def __init__(self, path, rng, interval=1):
+        #file the checkpoint is saved to
+        self.path = path
+        #random.Random instance of the run
+        self.rng = rng
+        #train() saves every interval generations
+        self.interval = interval
+        #{section name: dict of loop variables, ...}
+        self.sections = {}
+
+    #loads the saved checkpoint, if there is one. returns True if the run is resumed
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with gzip.open(self.path, 'rt') as f:
+            data = json.load(f)
+        self.sections = data['sections']
+        version, state, gauss_next = data['rng_state']
+        self.rng.setstate((version, tuple(state), gauss_next))
+        return True
+
+    #writes the checkpoint to a temporary file first, so an interruption never leaves a partial checkpoint
+    def save(self):
+        data = {'sections': self.sections, 'rng_state': self.rng.getstate()}
+        tmp_path = self.path + '.tmp'
+        with gzip.open(tmp_path, 'wt') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    #returns the saved loop variables of a section, or None if it has not started
+    def resume(self, name) -> dict:
+        return self.sections.get(name)
+
+    #records the loop variables of a section, to be written by the next save
+    def update(self, name, values: dict):
+        self.sections[name] = values
+
+    #forgets a finished section, so the next call of that level starts afresh
+    def clear(self, name):
+        self.sections.pop(name, None)
+
+    #deletes the saved checkpoint of a finished run
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -14,17 +14,11 @@ import pprint
 
 
 class States():
+    #the most teams that can be proposed in a game, 5 rounds of at most 5 proposals
+    MAX_PROPOSALS = 25
+
     def __init__(self, spy:bool,my_id:int, num_player:int, spys:list):
         self.valid_stages = ['VOTE','PROPOSE','BETRAY']
-        self.is_spy = spy
-        self.spys = spys
-        self.id = my_id
-        #number of past succeed missions
-        self.no_success = 0
-        #number of past failed missions
-        self.no_fail = 0
-        #number of time vote have been rejected
-        self.no_reject = 0
         #fail required matrix
         self.fails_required = {
             5:[1,1,1,1,1], \
@@ -34,17 +28,37 @@ class States():
             9:[1,1,1,2,1], \
             10:[1,1,1,2,1]
             }
-        
-        ## same index
-        #what are the past proposed mission
-        self.past_missions = []
-        #who voted what for each mission
-        self.past_votes = []
+
+        ## same index, one entry per proposal, allocated once for the largest game and reused by reset
+        #what are the past proposed mission, as bitmasks with bit p set if player p is on the team
+        self.past_missions = [0] * self.MAX_PROPOSALS
+        #who voted for each mission, as bitmasks with bit p set if player p voted for it
+        self.past_votes = [0] * self.MAX_PROPOSALS
         #who is the proposer of that mission
-        self.past_proposer = []
+        self.past_proposer = [0] * self.MAX_PROPOSALS
         #whether if that vote have succeed
-        self.vote_succeed = []
+        self.vote_succeed = [False] * self.MAX_PROPOSALS
+        self.reset(spy, my_id, num_player, spys)
+
+    #starts a new game, reusing the arrays of the last one
+    def reset(self, spy:bool,my_id:int, num_player:int, spys:list):
+        self.is_spy = spy
+        self.spys = spys
+        self.id = my_id
+        self.num_player = num_player
+        #number of past succeed missions
+        self.no_success = 0
+        #number of past failed missions
+        self.no_fail = 0
+        #number of time vote have been rejected
+        self.no_reject = 0
+        #number of entries of the past proposal arrays in use
+        self.no_proposals = 0
 
+        #True for each known spy. The per player values are plain lists, as they are only ever read one player at a time
+        self.spy_mask = [False] * num_player
+        for spy in spys:
+            self.spy_mask[spy] = True
         '''
         Expose rating of spy
         if is a spy the likely hood of each spy already exposed 
@@ -67,10 +81,9 @@ class States():
         #current stage
         self.stage = None
         self.current_mission = None
-        self.num_player = num_player
         self.next_proposer = 1
         self.this_proposer = 0
-        self.current_required_fails = self.fails_required[self.num_player][len(self.past_missions)]
+        self.current_required_fails = self.fails_required[self.num_player][self.no_proposals]
     
     #called at each call to agent 
     def update_stage(self,sta:str):
@@ -97,7 +110,7 @@ class States():
         if success:
             if self.is_spy:
                 for player in mission:
-                    if player in self.spys:
+                    if self.spy_mask[player]:
                         self.expose[player]-=0.1
             else:
                 for player in mission:
@@ -106,11 +119,12 @@ class States():
         else:
             if self.is_spy:
                 for player in mission:
-                    if player in self.spys:
+                    if self.spy_mask[player]:
                         self.expose[player]+=betryal_factor
-                if proposer in self.spys:
+                if self.spy_mask[proposer]:
                     self.expose[proposer]+=betryal_factor
             else:
+                #the proposer is blamed once for every player on the mission
                 for player in mission:
                     self.distrust[player]+=betryal_factor
                     self.distrust[proposer]+=betryal_factor
@@ -118,23 +132,55 @@ class States():
         self.update_fail_required()
     
     def update_vote(self, mission, proposer,votes):
-        self.past_proposer.append(proposer)
-        self.past_missions.append(mission)
-        self.past_votes.append(votes)
+        i = self.no_proposals
+        self.past_proposer[i] = proposer
+        mission_mask = 0
+        for p in mission:
+            mission_mask |= 1 << p
+        votes_mask = 0
+        for p in votes:
+            votes_mask |= 1 << p
+        self.past_missions[i] = mission_mask
+        self.past_votes[i] = votes_mask
+        self.no_proposals += 1
         self.update_proposer(proposer)
         if len(votes)*2 > self.num_player:
-            self.vote_succeed.append(True)
+            self.vote_succeed[i] = True
             self.no_reject = 0
         else:
-            self.vote_succeed.append(False)
+            self.vote_succeed[i] = False
             self.no_reject +=1
     
+    #indexed by the number of proposals so far rather than the round, as it always has been
     def update_fail_required(self):
-        if len(self.past_missions) <5:
-            self.current_required_fails = self.fails_required[self.num_player][len(self.past_missions)]
+        if self.no_proposals <5:
+            self.current_required_fails = self.fails_required[self.num_player][self.no_proposals]
+
+class CompiledTree():
+    '''
+    A decision tree dict flattened into a table of nodes, built by Tree.compile_tree.
+    Node 0 is the root. For node i, feature[i] is the id of the feature it branches on
+    (-1 for a leaf), its children are the nodes first_child[i] to first_child[i] + num_children[i] - 1,
+    and leaf[i] is the decision of a leaf.
+    '''
+    def __init__(self):
+        self.feature = []
+        self.first_child = []
+        self.num_children = []
+        self.leaf = []
+
+    def add_node(self, feature, leaf=None):
+        self.feature.append(feature)
+        self.first_child.append(-1)
+        self.num_children.append(0)
+        self.leaf.append(leaf)
+        return len(self.feature) - 1
+
 
 class Tree():
-    def __init__(self):
+    def __init__(self, rng=random):
+        #random number generator used for generating and mutating trees
+        self.rng = rng
         #func dict
         self.funcs = {
             'this_proposer': self.this_proposer,
@@ -145,6 +191,9 @@ class Tree():
             'num_mission_fail': self.num_mission_fail,
             'num_mission_success': self.num_mission_success
         }
+        #feature ids of compiled trees index into feature_funcs
+        self.feature_ids = {name: i for i, name in enumerate(self.funcs)}
+        self.feature_funcs = list(self.funcs.values())
         #num of branch of each param
         self.num_of_branch = {
             'this_proposer': 2,
@@ -259,6 +308,34 @@ class Tree():
         else:
             result = next_child[1]
         return result
+
+    #flatten a PROPOSE/VOTE/BETRAY tree dict into a CompiledTree, whose decisions match traverse_tree
+    def compile_tree(self, tree) -> CompiledTree:
+        compiled = CompiledTree()
+        root_feature, root_children = list(tree.items())[0]
+        pending = [(compiled.add_node(self.feature_ids[root_feature]), root_children)]
+        #children are added breadth first, so the children of a node are next to each other
+        for node, children in pending:
+            compiled.first_child[node] = len(compiled.feature)
+            compiled.num_children[node] = len(children)
+            for key, child in children.items():
+                if type(child) == dict:
+                    pending.append((compiled.add_node(self.feature_ids[key]), child))
+                else:
+                    compiled.add_node(-1, child)
+        return compiled
+
+    #generate decision from a compiled tree and game state object
+    def evaluate(self, compiled: CompiledTree, state):
+        feature = compiled.feature
+        funcs = self.feature_funcs
+        node = 0
+        while feature[node] >= 0:
+            index = funcs[feature[node]](state)
+            if index >= compiled.num_children[node]:
+                raise IndexError('branch ' + str(index) + ' of a node with ' + str(compiled.num_children[node]) + ' children')
+            node = compiled.first_child[node] + index
+        return compiled.leaf[node]
     
     #extract tree from jason 
     def tree_from_json(self, data):
@@ -277,12 +354,12 @@ class Tree():
             avaliable = [a for a in params +
                          used_params if a not in used_params]
             # terminate if by chance or if all params have been used
-            if random.random() > spliting_chance or avaliable == []:
-                dct["option_"+str(splits)] = random.random() < 0.5
+            if self.rng.random() > spliting_chance or avaliable == []:
+                dct["option_"+str(splits)] = self.rng.random() < 0.5
             # keep splitting
             else:
                 # select a
-                this_param = random.choice(avaliable)
+                this_param = self.rng.choice(avaliable)
                 used_params.append(this_param)
                 dct[this_param] = self.generate_vote_betray_tree(
                     params, used_params, self.num_of_branch[this_param], spliting_chance*split_decrease_rate,split_decrease_rate)
@@ -297,14 +374,14 @@ class Tree():
             avaliable = [a for a in params +
                          used_params if a not in used_params]
             # terminate if by chance or if all params have been used
-            if random.random() > spliting_chance or avaliable == []:
-                principle = random.choice(self.propose_option)
+            if self.rng.random() > spliting_chance or avaliable == []:
+                principle = self.rng.choice(self.propose_option)
                 #select 
                 dct["option_"+str(splits)] = principle
             # keep splitting
             else:
                 # select a
-                this_param = random.choice(avaliable)
+                this_param = self.rng.choice(avaliable)
                 used_params.append(this_param)
                 dct[this_param] = self.generate_propose_tree(
                     params, used_params, self.num_of_branch[this_param], spliting_chance*split_decrease_rate,split_decrease_rate)
@@ -315,15 +392,15 @@ class Tree():
     def generate_mutated_tree(self,tree,type_of_tree,mutate_rate):
         if type_of_tree == "VOTE" or type_of_tree == "BETRAY":
             for key in tree:
-                if random.random()<mutate_rate and type(tree[key])!= dict:
+                if self.rng.random()<mutate_rate and type(tree[key])!= dict:
                     tree[key] = not tree[key]
                 elif  type(tree[key]) == dict:
                     tree[key] = self.generate_mutated_tree(tree[key],"VOTE",mutate_rate)
             return tree
         else:
             for key in tree:
-                if random.random()<mutate_rate and type(tree[key])!= dict:
-                    tree[key] = random.choice(self.propose_option)
+                if self.rng.random()<mutate_rate and type(tree[key])!= dict:
+                    tree[key] = self.rng.choice(self.propose_option)
                 elif  type(tree[key]) == dict:
                     tree[key] = self.generate_mutated_tree(tree[key],"PROPOSE",mutate_rate)
             return tree
@@ -339,7 +416,7 @@ class Tree():
             select_rate = 1
         for key in tree_a:
             #keep searching
-            if random.random() > select_rate:
+            if self.rng.random() > select_rate:
                 if type(tree_a[key]) == dict:
                     seen = [param for param in tree_a if type(tree_a[key]) == dict]
                     seen = list(np.append(seen,existing_node))
@@ -384,13 +461,13 @@ class Tree():
     #generate random decision tree of type vote, betray or propose
     def generate_tree(self,type):
         if type == "VOTE" or type == "BETRAY":
-            initial = random.choice(self.vote_betray_param)
+            initial = self.rng.choice(self.vote_betray_param)
             tree = {
                 initial: self.generate_vote_betray_tree(self.vote_betray_param, [initial], self.num_of_branch[initial], 0.9,0.7)
             }
             return tree
         else:
-            initial = random.choice(self.propose_param)
+            initial = self.rng.choice(self.propose_param)
             tree = {
                 initial: self.generate_propose_tree(self.propose_param, [initial], self.num_of_branch[initial], 0.9,0.7)
             }
@@ -406,8 +483,10 @@ class DecisionTreeAgent(Agent):
         Nothing to do here.
         '''
         self.name = name
+        self.states = None
         self.pretrained = {'PROPOSE': {'num_mission_fail': {'next_proposer': {'num_mission_success': {'rejected_votes': {'option_2': 'enough_spy_exposed', 'option_1': 'enough_spy_exposed'}, 'option_2': 'enough_spy_not_exposed', 'option_1': 'enough_spy_not_exposed'}, 'fail_required': {'this_proposer': {'option_2': 'enough_spy_exposed', 'option_1': 'enough_spy_exposed'}, 'option_1': 'no_spy'}}, 'option_2': 'no_spy', 'option_1': 'enough_spy_not_exposed'}}, 'VOTE': {'mission': {'this_proposer': {'next_proposer': {'option_2': True, 'option_1': False}, 'option_1': False}, 'rejected_votes': {'fail_required': {'num_mission_fail': {'option_3': False, 'num_mission_success': {'option_3': True, 'option_2': False, 'option_1': False}, 'option_1': True}, 'option_1': False}, 'option_1': True}}}, 'BETRAY': {'mission': {'num_mission_success': {'this_proposer': {'option_2': True, 'option_1': True}, 'fail_required': {'next_proposer': {'option_2': True, 'num_mission_fail': {'option_3': False, 'rejected_votes': {'option_2': False, 'option_1': False}, 'option_1': True}}, 'option_1': True}, 'option_1': True}, 'option_1': True}}}
         self.thistree = [self.pretrained['PROPOSE'],self.pretrained['VOTE'],self.pretrained['BETRAY']]
+        self.compiled = [Tree().compile_tree(tree) for tree in self.thistree]
 
     def new_game(self, number_of_players, player_number, spy_list):
         '''
@@ -418,8 +497,12 @@ class DecisionTreeAgent(Agent):
         self.number_of_players = number_of_players
         self.player_number = player_number
         self.spy_list = spy_list
-        self.states = States(self.is_spy(),player_number,number_of_players,spy_list)
-        self.tree = Tree()
+        #one States is kept for the life of the agent and reset for each game
+        if self.states is None:
+            self.states = States(self.is_spy(),player_number,number_of_players,spy_list)
+        else:
+            self.states.reset(self.is_spy(),player_number,number_of_players,spy_list)
+        self.tree = Tree(self.rng)
 
     def is_spy(self):
         '''
@@ -438,7 +521,7 @@ class DecisionTreeAgent(Agent):
 
         if self.is_spy():
             team = []
-            principle = self.tree.traverse_tree(self.thistree[0],self.states)
+            principle = self.tree.evaluate(self.compiled[0],self.states)
             if principle == 'enough_spy_not_exposed' or  principle == 'enough_spy_exposed':
                 selected = 0
                 while selected < betrayals_required and len(team)<team_size:
@@ -463,12 +546,12 @@ class DecisionTreeAgent(Agent):
                     selected += 1
                 #fill up the rest
                 while len(team)<team_size:
-                    next = random.randrange(0,self.states.num_player)
+                    next = self.rng.randrange(0,self.states.num_player)
                     if next not in team:
                         team.append(next)
             elif principle == 'no_spy':
                 while len(team)<team_size:
-                    next = random.randrange(0,self.states.num_player)
+                    next = self.rng.randrange(0,self.states.num_player)
                     if next not in team:
                         team.append(next)
             else:
@@ -496,7 +579,7 @@ class DecisionTreeAgent(Agent):
         '''
         self.states.update_stage("VOTE")
         self.states.update_current_mission(mission,proposer)
-        return self.tree.traverse_tree(self.thistree[1],self.states)
+        return self.tree.evaluate(self.compiled[1],self.states)
 
 
     def vote_outcome(self, mission, proposer, votes):
@@ -515,7 +598,7 @@ class DecisionTreeAgent(Agent):
         self.states.update_stage("BETRAY")
         self.states.update_current_mission(mission, proposer)
         if self.is_spy():
-            return self.tree.traverse_tree(self.thistree[2],self.states)
+            return self.tree.evaluate(self.compiled[2],self.states)
         '''
         mission is a list of agents to be sent on a mission. 
         The agents on the mission are distinct and indexed between 0 and number_of_players, and include this agent.
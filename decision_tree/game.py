@@ -10,10 +10,17 @@ class Game:
     to share information and get game actions
     '''
 
-    def __init__(self, agents):
+    def __init__(self, agents, rng=None, recorder=None, profiler=None):
         '''
         agents is the list of agents playing the game
         the list must contain 5-10 agents
+        rng is the random.Random used for seating and spy assignment,
+        and to seed a generator for each agent. It defaults to the random module.
+        recorder is an optional recorder.GameRecorder, started on this game (see tournament.play_game),
+        that is given every mission and the outcome of the game.
+        profiler is an optional profiler.Profiler that times every call to the agents.
+        The rounds and missions are then played by the wrapped agents in self.players,
+        while self.agents remains the list of the agents themselves.
         This method initiaises the game by
         - shuffling the agents
         - randomly assigning spies
@@ -23,19 +30,23 @@ class Game:
         if len(agents)<5 or len(agents)>10:
             raise Exception('Agent array out of range')
         #clone and shuffle agent array
+        self.rng = random if rng is None else rng
+        self.recorder = recorder
         self.agents = agents.copy()
-        random.shuffle(self.agents)
+        self.rng.shuffle(self.agents)
+        self.players = self.agents if profiler is None else [profiler.wrap(agent) for agent in self.agents]
         self.num_players = len(agents)
         #allocate spies
         self.spies = []
         while len(self.spies) < Agent.spy_count[self.num_players]:
-            spy = random.randrange(self.num_players)
+            spy = self.rng.randrange(self.num_players)
             if spy not in self.spies:
                 self.spies.append(spy)
         #start game for each agent        
         for agent_id in range(self.num_players):
             spy_list = self.spies.copy() if agent_id in self.spies else []
-            self.agents[agent_id].new_game(self.num_players,agent_id, spy_list)
+            self.agents[agent_id].set_rng(random.Random(self.rng.getrandbits(64)))
+            self.players[agent_id].new_game(self.num_players,agent_id, spy_list)
         #initialise rounds
         self.missions_lost = 0
         self.rounds = []
@@ -44,13 +55,15 @@ class Game:
     def play(self):
         leader_id = 0
         for i in range(5):
-            self.rounds.append(Round(leader_id,self.agents, self.spies, i))
+            self.rounds.append(Round(leader_id,self.players, self.spies, i, self.recorder))
             if not self.rounds[i].play(): self.missions_lost+= 1
-            for a in self.agents:
+            for a in self.players:
                 a.round_outcome(i+1, self.missions_lost)
             leader_id = (leader_id+len(self.rounds[i].missions)) % len(self.agents)    
-        for a in self.agents:
+        for a in self.players:
             a.game_outcome(self.missions_lost<3, self.spies)
+        if self.recorder is not None:
+            self.recorder.end_game(self)
 
     def __str__(self):
         s = 'Game between agents:' + str(self.agents)
@@ -68,17 +81,19 @@ class Round():
     a representation of a round in the game.
     '''
 
-    def __init__(self, leader_id, agents, spies, rnd):
+    def __init__(self, leader_id, agents, spies, rnd, recorder=None):
         '''
         leader_id is the current leader (next to propose a mission)
         agents is the list of agents in the game,
         spies is the list of indexes of spies in the game
         rnd is what round the game is up to 
+        recorder is the game's recorder, if any
         '''
         self.leader_id = leader_id
         self.agents = agents
         self.spies = spies
         self.rnd = rnd
+        self.recorder = recorder
         self.missions = []
 
     def __str__(self):
@@ -98,10 +113,10 @@ class Round():
         '''
         produces a formal representation of the round
         '''
-        s = 'Round(leader_id=' + self.leader_id \
-                + ', agents=' + self.agents \
-                + ', rnd=' + self.rnd \
-                + ', missions=' + self.missions+')'
+        s = 'Round(leader_id=' + str(self.leader_id) \
+                + ', agents=' + str(self.agents) \
+                + ', rnd=' + str(self.rnd) \
+                + ', missions=' + str(self.missions)+')'
         return s        
 
     def play(self):
@@ -114,7 +129,7 @@ class Round():
         fails_required = Agent.fails_required[len(self.agents)][self.rnd]
         while len(self.missions)<5:
             team = self.agents[self.leader_id].propose_mission(mission_size, fails_required)
-            mission = Mission(self.leader_id, team, self.agents, self.spies, self.rnd)
+            mission = Mission(self.leader_id, team, self.agents, self.spies, self.rnd, self.recorder)
             self.missions.append(mission)
             self.leader_id = (self.leader_id+1) % len(self.agents)
             if mission.is_approved():
@@ -133,19 +148,21 @@ class Mission():
     a representation of a proposed mission
     '''
     
-    def __init__(self, leader_id, team, agents, spies, rnd):
+    def __init__(self, leader_id, team, agents, spies, rnd, recorder=None):
         '''
         leader_id is the id of the agent who proposed the mission
         team is the list of agent indexes on the mission
         agents is the list of agents in the game,
         spies is the list of indexes of spies in the game
         rnd is the round number of the game
+        recorder is the game's recorder, if any
         '''
         self.leader_id = leader_id
         self.team = team
         self.agents = agents
         self.spies = spies
         self.rnd = rnd
+        self.recorder = recorder
         self.run()
 
 
@@ -163,6 +180,8 @@ class Mission():
             success = len(self.fails) < Agent.fails_required[len(self.agents)][self.rnd]
             for a in self.agents:
                 a.mission_outcome(self.team,self.leader_id, len(self.fails), success)
+        if self.recorder is not None:
+            self.recorder.record_mission(self)
 
 
 
@@ -187,12 +206,12 @@ class Mission():
         '''
         Creates formal (json) representation of the mission
         '''
-        return 'Mission(leader_id='+ self.agents[leader_id] \
-                       + ', team='+self.team \
-                       +', agents='+self.agents \
-                       +', rnd='+self.rnd \
-                       +', votes_for='+self.votes_for \
-                       +', fail_num=' +len(self.fails)+')'
+        return 'Mission(leader_id='+ str(self.leader_id) \
+                       + ', team='+str(self.team) \
+                       +', agents='+str(self.agents) \
+                       +', rnd='+str(self.rnd) \
+                       +', votes_for='+str(self.votes_for) \
+                       +', fail_num=' +(str(len(self.fails)) if self.is_approved() else 'None')+')'
 
     
     def is_approved(self):
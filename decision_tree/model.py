@@ -1,17 +1,11 @@
 
 
 class States():
+    #the most teams that can be proposed in a game, 5 rounds of at most 5 proposals
+    MAX_PROPOSALS = 25
+
     def __init__(self, spy:bool,my_id:int, num_player:int, spys:list):
         self.valid_stages = ['VOTE','PROPOSE','BETRAY']
-        self.is_spy = spy
-        self.spys = spys
-        self.id = my_id
-        #number of past succeed missions
-        self.no_success = 0
-        #number of past failed missions
-        self.no_fail = 0
-        #number of time vote have been rejected
-        self.no_reject = 0
         #fail required matrix
         self.fails_required = {
             5:[1,1,1,1,1], \
@@ -21,17 +15,37 @@ class States():
             9:[1,1,1,2,1], \
             10:[1,1,1,2,1]
             }
-        
-        ## same index
-        #what are the past proposed mission
-        self.past_missions = []
-        #who voted what for each mission
-        self.past_votes = []
+
+        ## same index, one entry per proposal, allocated once for the largest game and reused by reset
+        #what are the past proposed mission, as bitmasks with bit p set if player p is on the team
+        self.past_missions = [0] * self.MAX_PROPOSALS
+        #who voted for each mission, as bitmasks with bit p set if player p voted for it
+        self.past_votes = [0] * self.MAX_PROPOSALS
         #who is the proposer of that mission
-        self.past_proposer = []
+        self.past_proposer = [0] * self.MAX_PROPOSALS
         #whether if that vote have succeed
-        self.vote_succeed = []
+        self.vote_succeed = [False] * self.MAX_PROPOSALS
+        self.reset(spy, my_id, num_player, spys)
 
+    #starts a new game, reusing the arrays of the last one
+    def reset(self, spy:bool,my_id:int, num_player:int, spys:list):
+        self.is_spy = spy
+        self.spys = spys
+        self.id = my_id
+        self.num_player = num_player
+        #number of past succeed missions
+        self.no_success = 0
+        #number of past failed missions
+        self.no_fail = 0
+        #number of time vote have been rejected
+        self.no_reject = 0
+        #number of entries of the past proposal arrays in use
+        self.no_proposals = 0
+
+        #True for each known spy. The per player values are plain lists, as they are only ever read one player at a time
+        self.spy_mask = [False] * num_player
+        for spy in spys:
+            self.spy_mask[spy] = True
         '''
         Expose rating of spy
         if is a spy the likely hood of each spy already exposed 
@@ -54,10 +68,9 @@ class States():
         #current stage
         self.stage = None
         self.current_mission = None
-        self.num_player = num_player
         self.next_proposer = 1
         self.this_proposer = 0
-        self.current_required_fails = self.fails_required[self.num_player][len(self.past_missions)]
+        self.current_required_fails = self.fails_required[self.num_player][self.no_proposals]
     
     #called at each call to agent 
     def update_stage(self,sta:str):
@@ -84,7 +97,7 @@ class States():
         if success:
             if self.is_spy:
                 for player in mission:
-                    if player in self.spys:
+                    if self.spy_mask[player]:
                         self.expose[player]-=0.1
             else:
                 for player in mission:
@@ -93,11 +106,12 @@ class States():
         else:
             if self.is_spy:
                 for player in mission:
-                    if player in self.spys:
+                    if self.spy_mask[player]:
                         self.expose[player]+=betryal_factor
-                if proposer in self.spys:
+                if self.spy_mask[proposer]:
                     self.expose[proposer]+=betryal_factor
             else:
+                #the proposer is blamed once for every player on the mission
                 for player in mission:
                     self.distrust[player]+=betryal_factor
                     self.distrust[proposer]+=betryal_factor
@@ -105,17 +119,26 @@ class States():
         self.update_fail_required()
     
     def update_vote(self, mission, proposer,votes):
-        self.past_proposer.append(proposer)
-        self.past_missions.append(mission)
-        self.past_votes.append(votes)
+        i = self.no_proposals
+        self.past_proposer[i] = proposer
+        mission_mask = 0
+        for p in mission:
+            mission_mask |= 1 << p
+        votes_mask = 0
+        for p in votes:
+            votes_mask |= 1 << p
+        self.past_missions[i] = mission_mask
+        self.past_votes[i] = votes_mask
+        self.no_proposals += 1
         self.update_proposer(proposer)
         if len(votes)*2 > self.num_player:
-            self.vote_succeed.append(True)
+            self.vote_succeed[i] = True
             self.no_reject = 0
         else:
-            self.vote_succeed.append(False)
+            self.vote_succeed[i] = False
             self.no_reject +=1
     
+    #indexed by the number of proposals so far rather than the round, as it always has been
     def update_fail_required(self):
-        if len(self.past_missions) <5:
-            self.current_required_fails = self.fails_required[self.num_player][len(self.past_missions)]
\ No newline at end of file
+        if self.no_proposals <5:
+            self.current_required_fails = self.fails_required[self.num_player][self.no_proposals]
\ No newline at end of file
@@ -1,6 +1,5 @@
 from typing import Tuple
 from agent import Agent
-import random
 import numpy as np
 from model import States
 from tree import Tree
@@ -12,13 +11,17 @@ import pprint
 class MyAgent(Agent):        
     '''A sample implementation of a random agent in the game The Resistance'''
 
-    def __init__(self, name='Rando',tree=None):
+    def __init__(self, name='Rando',tree=None,compiled=None):
         '''
         Initialises the agent.
-        Nothing to do here.
+        tree is a PROPOSE, VOTE and BETRAY tree triple, or compiled the same triple already compiled
+        by Tree.compile_tree, so agents made for every training game share the trees compiled once per generation.
         '''
         self.name = name
+        self.states = None
         self.thistree = tree
+        #trees are compiled rather than walked as dicts on every decision
+        self.compiled = compiled if compiled is not None or tree is None else [Tree().compile_tree(t) for t in tree]
 
     def new_game(self, number_of_players, player_number, spy_list):
         '''
@@ -29,8 +32,12 @@ class MyAgent(Agent):
         self.number_of_players = number_of_players
         self.player_number = player_number
         self.spy_list = spy_list
-        self.states = States(self.is_spy(),player_number,number_of_players,spy_list)
-        self.tree = Tree()
+        #one States is kept for the life of the agent and reset for each game
+        if self.states is None:
+            self.states = States(self.is_spy(),player_number,number_of_players,spy_list)
+        else:
+            self.states.reset(self.is_spy(),player_number,number_of_players,spy_list)
+        self.tree = Tree(self.rng)
 
     def is_spy(self):
         '''
@@ -49,7 +56,7 @@ class MyAgent(Agent):
 
         if self.is_spy():
             team = []
-            principle = self.tree.traverse_tree(self.thistree[0],self.states)
+            principle = self.tree.evaluate(self.compiled[0],self.states)
             if principle == 'enough_spy_not_exposed' or  principle == 'enough_spy_exposed':
                 selected = 0
                 while selected < betrayals_required and len(team)<team_size:
@@ -74,12 +81,12 @@ class MyAgent(Agent):
                     selected += 1
                 #fill up the rest
                 while len(team)<team_size:
-                    next = random.randrange(0,self.states.num_player)
+                    next = self.rng.randrange(0,self.states.num_player)
                     if next not in team:
                         team.append(next)
             elif principle == 'no_spy':
                 while len(team)<team_size:
-                    next = random.randrange(0,self.states.num_player)
+                    next = self.rng.randrange(0,self.states.num_player)
                     if next not in team:
                         team.append(next)
             else:
@@ -107,7 +114,7 @@ class MyAgent(Agent):
         '''
         self.states.update_stage("VOTE")
         self.states.update_current_mission(mission,proposer)
-        return self.tree.traverse_tree(self.thistree[1],self.states)
+        return self.tree.evaluate(self.compiled[1],self.states)
 
 
     def vote_outcome(self, mission, proposer, votes):
@@ -126,7 +133,7 @@ class MyAgent(Agent):
         self.states.update_stage("BETRAY")
         self.states.update_current_mission(mission, proposer)
         if self.is_spy():
-            return self.tree.traverse_tree(self.thistree[2],self.states)
+            return self.tree.evaluate(self.compiled[2],self.states)
         '''
         mission is a list of agents to be sent on a mission. 
         The agents on the mission are distinct and indexed between 0 and number_of_players, and include this agent.
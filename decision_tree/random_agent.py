@@ -1,5 +1,4 @@
 from agent import Agent
-import random
 
 class RandomAgent(Agent):        
     '''A sample implementation of a random agent in the game The Resistance'''
@@ -35,7 +34,7 @@ class RandomAgent(Agent):
         '''
         team = []
         while len(team)<team_size:
-            agent = random.randrange(team_size)
+            agent = self.rng.randrange(team_size)
             if agent not in team:
                 team.append(agent)
         return team        
@@ -47,7 +46,7 @@ class RandomAgent(Agent):
         proposer is an int between 0 and number_of_players and is the index of the player who proposed the mission.
         The function should return True if the vote is for the mission, and False if the vote is against the mission.
         '''
-        return random.random()<0.5
+        return self.rng.random()<0.5
 
     def vote_outcome(self, mission, proposer, votes):
         '''
@@ -69,7 +68,7 @@ class RandomAgent(Agent):
         By default, spies will betray 30% of the time. 
         '''
         if self.is_spy():
-            return random.random()<0.3
+            return self.rng.random()<0.3
 
     def mission_outcome(self, mission, proposer, betrayals, mission_success):
         '''
@@ -1,6 +1,11 @@
 from game import Game
 from decision_tree_agent import DecisionTreeAgent
 from random_agent import RandomAgent
+import os
+import sys
+#win rates are kept by the OnlineStats of the tournament runner in the parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from online_stats import OnlineStats
 agent_to_index = {
         'Agent alpha':0,
         'Agent beta':1, 
@@ -30,45 +35,28 @@ for i in range(6):
         agents.append(RandomAgent(name=agname[i]))
         i+=1
 
-    spy_rounds_won = 0
-    resistance_round_won = 0
+    #at most total_rounds games, stopping once alpha's win rates are known to within target_width
     total_rounds = 5000
-    game_as_resistance = 0
-    game_as_spy = 0
+    target_width = 0.05
+    check_every = 100
+    stats = OnlineStats(1, target_width)
     for i in range(total_rounds):
         game = Game(agents)
         game.play()
         agents = game.agents
         spies = game.spies
-        id = None
-        resistance = [i for i in range(len(agents)) if i not in spies ]
-        for i in range(len(agents)):
-            if str(agents[i]) == 'Agent alpha':
-                id = i
-        if id is not None:
-            if i in resistance:
-                game_as_resistance += 1
-            elif i in spies:
-                game_as_spy += 1
-        winners = []
-        winner = None
-        if game.missions_lost>3:
-            winner = "SPY"
-            for spy in spies:
-                winners.append(agent_to_index[str(agents[spy])])
-                if "Agent alpha" == str(agents[spy]):
-                    spy_rounds_won += 1
-        else:
-            for res in resistance:
-                winners.append(agent_to_index[str(agents[res])])
-                if "Agent alpha" == str(agents[res]):
-                    resistance_round_won += 1
-            winner = "RESISTANCE"
+        for id in range(len(agents)):
+            if str(agents[id]) == 'Agent alpha':
+                stats.record(0, id in spies, (game.missions_lost >= 3) == (id in spies))
+        if (i+1) % check_every == 0 and stats.done():
+            break
+    s = stats.stats[0]
     print("Number of decision tree agents",num_decision)
     print("Number of random agents",num_random)
-    print("win rate:{}%".format((spy_rounds_won+resistance_round_won)/total_rounds*100))
-    print("win rate as resistance:{}%".format(resistance_round_won/game_as_resistance*100))
-    print("win rate as spy:{}%".format(spy_rounds_won/game_as_spy*100))
+    print("games played:",stats.games)
+    print("win rate:{}% {}".format((s['spy_wins']+s['resistance_wins'])/stats.games*100, stats.interval(0)))
+    print("win rate as resistance:{}% {}".format(s['resistance_wins']/s['resistance_games']*100, stats.interval(0, 'resistance')))
+    print("win rate as spy:{}% {}".format(s['spy_wins']/s['spy_games']*100, stats.interval(0, 'spy')))
 
 
 
@@ -1,14 +1,27 @@
 from numpy.core.fromnumeric import trace
 from game import Game
 from myagent import MyAgent
-from tree import Tree
+from tree import Tree, TreeBatch
 from random_agent import RandomAgent
+from checkpoint import Checkpoint
+from concurrent.futures import ProcessPoolExecutor
 import random
 import numpy as np
 import pprint
 import copy
+import json
+import os
 
-def train():
+#the fitness games of a generation are split into this many tasks for the process pool
+NUM_WORKERS = os.cpu_count()
+#progress of the run is saved here, and an interrupted run resumes from it
+CHECKPOINT_PATH = 'checkpoint.json.gz'
+#random trees are picked from this many times as many candidates, skipping those that decide like a tree already picked.
+#1 keeps every random tree, as training always has; raise it to screen out duplicate behaviours
+SCREEN_FACTOR = 1
+
+#rng is the random number generator of the run, and checkpoint is an optional Checkpoint saving its progress
+def train(executor=None, rng=random, checkpoint=None):
     num_player = 7
     total_rounds = 10 
     total_set = num_player*2
@@ -30,23 +43,30 @@ def train():
     ]
 
 
-    for i in range(total_rounds):
+    start = 0
+    saved = checkpoint.resume('train') if checkpoint is not None else None
+    if saved is not None:
+        start, winner, initial = saved['generation'], saved['winner'], saved['initial']
+
+    for i in range(start, total_rounds):
         iteration = int(i/interval)
         if iteration > 9:
             print("invalid round")
             return None
         total_set = []
         total_set.extend(winner)
-        next_ramdom = generate_random_trees(exploit_explore[iteration][1])
+        next_ramdom = generate_random_trees(exploit_explore[iteration][1], rng, winner)
         total_set.extend(next_ramdom)
-        next_gen = generate_next_generation(winner,exploit_explore[iteration][2],0)
+        next_gen = generate_next_generation(winner,exploit_explore[iteration][2],0,rng)
         total_set.extend(next_gen)
-        next_mutate = generate_mutated_generation(winner,exploit_explore[iteration][3])
+        next_mutate = generate_mutated_generation(winner,exploit_explore[iteration][3],rng)
         total_set.extend(next_mutate)
         train_game_per_round = 35
-        score_of_each_tree = [0]*14
+        #the sets of trees playing each pair of games, and the seeds of those games
+        pairings = []
+        seeds = []
         if i == 0:
-            initial =  random.choices(total_set,  k = 2)
+            initial =  rng.choices(total_set,  k = 2)
         while train_game_per_round > 0:
             #split in to two sets to play two games
             tree_set_1 = []
@@ -54,7 +74,7 @@ def train():
             used = []
             i1 = 0
             while i1 < num_player:
-                x = random.randrange(len(total_set))
+                x = rng.randrange(len(total_set))
                 if total_set[x] not in tree_set_1:
                     tree_set_1.append(total_set[x])
                     tree_index_1.append(x)
@@ -71,15 +91,10 @@ def train():
             
             if len(tree_set_1)<7 or len(tree_set_2)<7:
                 print("error")
-            winner_1,winning_tree_1 = play_game(tree_set_1)
-            winner_2,winning_tree_2 = play_game(tree_set_2)
-
-            for i in winning_tree_1:
-                score_of_each_tree[tree_index_1[i]]+=1
-
-            for i in winning_tree_2:
-                score_of_each_tree[tree_index_2[i]]+=1
+            pairings.append((tree_index_1, tree_index_2))
+            seeds.append((rng.getrandbits(32), rng.getrandbits(32)))
             train_game_per_round -=1
+        score_of_each_tree = play_fitness_games(compile_trees(total_set), pairings, seeds, executor)
         winner = []
         included = 0
         while included < exploit_explore[iteration][0]:
@@ -91,10 +106,46 @@ def train():
                     high_score = score_of_each_tree[x]
             winner.append(total_set[current_winner])
             included += 1
+        if checkpoint is not None:
+            checkpoint.update('train', {'generation': i + 1, 'winner': winner, 'initial': initial, 'scores': score_of_each_tree})
+            if (i + 1) % checkpoint.interval == 0:
+                checkpoint.save()
+    if checkpoint is not None:
+        checkpoint.clear('train')
     return winner, initial
+
+
+#compiles every tree triple of a population once, for all the games it plays
+def compile_trees(triples):
+    tree_obj = Tree()
+    return [[tree_obj.compile_tree(tree) for tree in triple] for triple in triples]
+
+#plays the fitness games of a generation, in the process pool if one is given, and returns the score of each tree.
+#total_set is the compiled population (see compile_trees), sent once to each task rather than once per game
+def play_fitness_games(total_set, pairings, seeds, executor=None):
+    if executor is None:
+        return fitness_games(total_set, pairings, seeds)
+    futures = [executor.submit(fitness_games, total_set, pairings[w::NUM_WORKERS], seeds[w::NUM_WORKERS]) 
+               for w in range(min(NUM_WORKERS, len(pairings)))]
+    score_of_each_tree = [0]*len(total_set)
+    for future in futures:
+        score_of_each_tree = [a + b for a, b in zip(score_of_each_tree, future.result())]
+    return score_of_each_tree
+
+
+#plays one game for each set of tree indexes in each pairing, and returns the number of games each compiled tree triple of total_set won
+def fitness_games(total_set, pairings, seeds):
+    score_of_each_tree = [0]*len(total_set)
+    for tree_indexes, game_seeds in zip(pairings, seeds):
+        for tree_index, seed in zip(tree_indexes, game_seeds):
+            winner,winning_tree = play_game([total_set[x] for x in tree_index], random.Random(seed))
+            for i in winning_tree:
+                score_of_each_tree[tree_index[i]]+=1
+    return score_of_each_tree
         
 
-def play_game(trees):
+#plays a game between seven compiled tree triples, and returns the winning side and the indexes of its trees
+def play_game(trees, rng=None):
     agent_to_index = {
         'Agent alpha':0,
         'Agent beta':1, 
@@ -104,15 +155,15 @@ def play_game(trees):
         'Agent zeta':5, 
         'Agent eta':6
     }
-    agents = [MyAgent(name='alpha',tree=trees[0]), 
-        MyAgent(name='beta',tree=trees[1]),  
-        MyAgent(name='gamma',tree=trees[2]),  
-        MyAgent(name='delta',tree=trees[3]),  
-        MyAgent(name='epslion',tree=trees[4]),  
-        MyAgent(name='zeta',tree=trees[5]),  
-        MyAgent(name='eta',tree=trees[6])]
+    agents = [MyAgent(name='alpha',compiled=trees[0]), 
+        MyAgent(name='beta',compiled=trees[1]),  
+        MyAgent(name='gamma',compiled=trees[2]),  
+        MyAgent(name='delta',compiled=trees[3]),  
+        MyAgent(name='epslion',compiled=trees[4]),  
+        MyAgent(name='zeta',compiled=trees[5]),  
+        MyAgent(name='eta',compiled=trees[6])]
 
-    game = Game(agents)
+    game = Game(agents, rng)
     game.play()
     agents = game.agents
     spies = game.spies
@@ -130,25 +181,49 @@ def play_game(trees):
     return winner,winning_trees
 
 
-def generate_random_trees(num):
+#generates num random tree triples, preferring ones that decide differently from each other and from population
+def generate_random_trees(num, rng=random, population=[]):
+    tree_obj = Tree(rng)
+    candidates = [None]*(num*SCREEN_FACTOR)
+    for i in range(len(candidates)):
+        candidates[i] = [tree_obj.generate_tree("PROPOSE"),tree_obj.generate_tree("VOTE"),tree_obj.generate_tree("BETRAY")]
+    if SCREEN_FACTOR == 1 or num == 0:
+        return candidates
+
+    signatures = behaviour_signatures(population + candidates)
+    seen = set(signatures[:len(population)])
+    trees = []
+    skipped = []
+    for candidate, signature in zip(candidates, signatures[len(population):]):
+        if len(trees) == num:
+            break
+        if signature in seen:
+            skipped.append(candidate)
+        else:
+            seen.add(signature)
+            trees.append(candidate)
+    return trees + skipped[:num - len(trees)]
+
+#returns a signature of the decisions of each tree triple for every combination of features.
+#triples with the same signature make the same decisions in every game state
+def behaviour_signatures(triples):
     tree_obj = Tree()
-    trees = [None]*num
-    for i in range(len(trees)):
-        trees[i] = [tree_obj.generate_tree("PROPOSE"),tree_obj.generate_tree("VOTE"),tree_obj.generate_tree("BETRAY")]
-    return trees
+    domain = tree_obj.feature_domain()
+    codes = [TreeBatch([tree_obj.compile_tree(triple[i]) for triple in triples]).evaluate_codes(domain) for i in range(3)]
+    return [row.tobytes() for row in np.concatenate(codes, axis=1)]
 
 #list of list of 3 trees select from random 
-def generate_next_generation(winner,num,select_rate):
-    tree_obj = Tree()
+def generate_next_generation(winner,num,select_rate,rng=random):
+    tree_obj = Tree(rng)
     used_pair = []
     trees = []
     while num > 0:
         found = False
         while not found:
-            current_pair = [winner[random.randrange(len(winner))]]
+            current_pair = [winner[rng.randrange(len(winner))]]
             next = None
             while next == None:
-                next = random.randrange(len(winner))
+                next = rng.randrange(len(winner))
                 if winner[next] != current_pair[0]:
                     current_pair.append(winner[next])
                 else: 
@@ -170,14 +245,14 @@ def generate_next_generation(winner,num,select_rate):
         num -= 1
     return trees
 
-def generate_mutated_generation(winner,num):
-    tree_obj = Tree()
+def generate_mutated_generation(winner,num,rng=random):
+    tree_obj = Tree(rng)
     used = []
     trees = []
     while num > 0:
         mutant = None
         while mutant == None:
-            c = random.choice(winner)
+            c = rng.choice(winner)
             if c not in used and c is not None:
                 mutant = copy.deepcopy(c)
         set_of_trees = [tree_obj.generate_mutated_tree(mutant[0],"PROPOSE",0.5),\
@@ -188,20 +263,22 @@ def generate_mutated_generation(winner,num):
     return trees
 
     
-def check_difference():
-    trained,initial = train()
+def check_difference(executor=None, rng=random, checkpoint=None):
+    trained,initial = train(executor, rng, checkpoint)
     test = copy.deepcopy(trained)
     test.extend(initial)
     #trained : 0,1 // initial 2,3// rest are random
     score_of_each_tree = [0]*7
+    compiled = compile_trees(test)
     for i in range(40):
-        winner,winning_tree = test_game(test)
+        winner,winning_tree = test_game(compiled, rng)
         for i in winning_tree:
             score_of_each_tree[i]+=1
     return score_of_each_tree,trained
     
 
-def test_game(trees):
+#plays a game between four compiled tree triples and three RandomAgents
+def test_game(trees, rng=None):
     if len(trees)!= 4:
         return None,None
     agent_to_index = {
@@ -213,15 +290,15 @@ def test_game(trees):
         'Agent zeta':5, 
         'Agent eta':6
     }
-    agents = [MyAgent(name='alpha',tree=trees[0]), 
-        MyAgent(name='beta',tree=trees[1]),  
-        MyAgent(name='gamma',tree=trees[2]),  
-        MyAgent(name='delta',tree=trees[3]),  
+    agents = [MyAgent(name='alpha',compiled=trees[0]), 
+        MyAgent(name='beta',compiled=trees[1]),  
+        MyAgent(name='gamma',compiled=trees[2]),  
+        MyAgent(name='delta',compiled=trees[3]),  
         RandomAgent(name='epslion'),  
         RandomAgent(name='zeta'),  
         RandomAgent(name='eta')]
 
-    game = Game(agents)
+    game = Game(agents, rng)
     game.play()
     #print(game)
     agents = game.agents
@@ -240,13 +317,18 @@ def test_game(trees):
     return winner,winning_trees
 
 #checks converge 
-def check_converge():
+def check_converge(executor=None, rng=random, checkpoint=None):
     total = 0
     current_best_score = 0
     converged_tree = None
     converge = 0
-    for i in range(20):
-        score,trained = check_difference()
+    start = 0
+    saved = checkpoint.resume('converge') if checkpoint is not None else None
+    if saved is not None:
+        start, converge = saved['runs'], saved['converge']
+        current_best_score, converged_tree = saved['current_best_score'], saved['converged_tree']
+    for run in range(start, 20):
+        score,trained = check_difference(executor, rng, checkpoint)
         total = score[0] + score[1] - score[2] - score[3]
         print("trained tree win {} more games than random decision tree".format(total))
         if total > 0:
@@ -256,6 +338,12 @@ def check_converge():
                 if score[i] > current_best_score:
                     current_best_score = score[i]
                     converged_tree = trained[i]
+        if checkpoint is not None:
+            checkpoint.update('converge', {'runs': run + 1, 'converge': converge, 
+                'current_best_score': current_best_score, 'converged_tree': converged_tree})
+            checkpoint.save()
+    if checkpoint is not None:
+        checkpoint.clear('converge')
     tree_dict = {
         'PROPOSE':converged_tree[0],
         'VOTE':converged_tree[1],
@@ -265,17 +353,26 @@ def check_converge():
     return converge, current_best_score, tree_dict
 
 
-def generate_end_tree():
+def generate_end_tree(executor=None, rng=random, checkpoint=None):
     total_converge = 0
     high_score = 0
     final_tree = None
     rnds = 10
-    for i in range(rnds):
-        converge, score, tree = check_converge()
+    start = 0
+    saved = checkpoint.resume('end_tree') if checkpoint is not None else None
+    if saved is not None:
+        start, total_converge = saved['rnds'], saved['total_converge']
+        high_score, final_tree = saved['high_score'], saved['final_tree']
+    for i in range(start, rnds):
+        converge, score, tree = check_converge(executor, rng, checkpoint)
         if score > high_score:
             final_tree = tree
             high_score = score
         total_converge += converge
+        if checkpoint is not None:
+            checkpoint.update('end_tree', {'rnds': i + 1, 'total_converge': total_converge, 
+                'high_score': high_score, 'final_tree': final_tree})
+            checkpoint.save()
     average_converge = total_converge/rnds
     print("tree converged: {}/20 times on average".format(average_converge))
     print("the best tree generated: ")
@@ -284,4 +381,16 @@ def generate_end_tree():
     print("|-------------------------------------------------------------------------------------------------")
     return final_tree
 
-generate_end_tree()
\ No newline at end of file
+if __name__ == '__main__':
+    rng = random.Random()
+    checkpoint = Checkpoint(CHECKPOINT_PATH, rng)
+    if checkpoint.load():
+        print("resuming from {}".format(CHECKPOINT_PATH))
+    with ProcessPoolExecutor(max_workers=NUM_WORKERS) as executor:
+        final_tree = generate_end_tree(executor, rng, checkpoint)
+    if final_tree is not None:
+        #branches are picked by position, so the keys are kept in the order the trees were made in
+        with open('tree.json', 'w') as f:
+            json.dump(final_tree, f, indent=4)
+    #the run is finished, so the next run starts afresh
+    checkpoint.remove()
\ No newline at end of file
@@ -3,10 +3,91 @@ import random
 from model import States
 import numpy as np
 import pprint
+from itertools import product
 
 
-class Tree():
+class CompiledTree():
+    '''
+    A decision tree dict flattened into a table of nodes, built by Tree.compile_tree.
+    Node 0 is the root. For node i, feature[i] is the id of the feature it branches on
+    (-1 for a leaf), its children are the nodes first_child[i] to first_child[i] + num_children[i] - 1,
+    and leaf[i] is the decision of a leaf.
+    '''
     def __init__(self):
+        self.feature = []
+        self.first_child = []
+        self.num_children = []
+        self.leaf = []
+
+    def add_node(self, feature, leaf=None):
+        self.feature.append(feature)
+        self.first_child.append(-1)
+        self.num_children.append(0)
+        self.leaf.append(leaf)
+        return len(self.feature) - 1
+
+
+class TreeBatch():
+    '''
+    A population of compiled trees padded into (trees, nodes) numpy arrays, so every tree of the population
+    is evaluated at once against feature vectors, the branch of every feature indexed by feature id
+    (such as the rows of Tree.feature_domain).
+    Leaf decisions are stored as codes, indexes into values.
+    '''
+    def __init__(self, compiled_trees):
+        num_trees = len(compiled_trees)
+        num_nodes = max(len(c.feature) for c in compiled_trees)
+        self.feature = np.full((num_trees, num_nodes), -1, dtype=np.int64)
+        self.first_child = np.zeros((num_trees, num_nodes), dtype=np.int64)
+        self.num_children = np.zeros((num_trees, num_nodes), dtype=np.int64)
+        self.leaf = np.full((num_trees, num_nodes), -1, dtype=np.int64)
+        #decision of each leaf code
+        self.values = []
+        codes = {}
+        for t, c in enumerate(compiled_trees):
+            n = len(c.feature)
+            self.feature[t, :n] = c.feature
+            self.first_child[t, :n] = c.first_child
+            self.num_children[t, :n] = c.num_children
+            for node in range(n):
+                if c.feature[node] < 0:
+                    if c.leaf[node] not in codes:
+                        codes[c.leaf[node]] = len(self.values)
+                        self.values.append(c.leaf[node])
+                    self.leaf[t, node] = codes[c.leaf[node]]
+
+    #evaluate every tree on each row of features, a (decision points, features) array.
+    #returns a (trees, decision points) array of leaf codes, -1 where a feature has no matching branch
+    def evaluate_codes(self, features):
+        features = np.atleast_2d(features)
+        rows = np.arange(len(self.feature))[:, None]
+        points = np.arange(len(features))[None, :]
+        node = np.zeros((len(self.feature), len(features)), dtype=np.int64)
+        valid = np.ones(node.shape, dtype=bool)
+        #every level of a tree branches on a different feature, so this runs at most once per feature
+        while True:
+            feature = self.feature[rows, node]
+            active = (feature >= 0) & valid
+            if not active.any():
+                break
+            branch = features[points, np.where(active, feature, 0)]
+            in_range = branch < self.num_children[rows, node]
+            valid &= ~active | in_range
+            active &= in_range
+            node = np.where(active, self.first_child[rows, node] + branch, node)
+        codes = self.leaf[rows, node]
+        codes[~valid] = -1
+        return codes
+
+    #returns the decision of every tree for one feature vector, None where a tree has no matching branch
+    def evaluate(self, feature_vector) -> list:
+        return [self.values[code] if code >= 0 else None for code in self.evaluate_codes(feature_vector)[:, 0]]
+
+
+class Tree():
+    def __init__(self, rng=random):
+        #random number generator used for generating and mutating trees
+        self.rng = rng
         #func dict
         self.funcs = {
             'this_proposer': self.this_proposer,
@@ -17,6 +98,9 @@ class Tree():
             'num_mission_fail': self.num_mission_fail,
             'num_mission_success': self.num_mission_success
         }
+        #feature ids of compiled trees index into feature_funcs
+        self.feature_ids = {name: i for i, name in enumerate(self.funcs)}
+        self.feature_funcs = list(self.funcs.values())
         #num of branch of each param
         self.num_of_branch = {
             'this_proposer': 2,
@@ -131,6 +215,38 @@ class Tree():
         else:
             result = next_child[1]
         return result
+
+    #flatten a PROPOSE/VOTE/BETRAY tree dict into a CompiledTree, whose decisions match traverse_tree
+    def compile_tree(self, tree) -> CompiledTree:
+        compiled = CompiledTree()
+        root_feature, root_children = list(tree.items())[0]
+        pending = [(compiled.add_node(self.feature_ids[root_feature]), root_children)]
+        #children are added breadth first, so the children of a node are next to each other
+        for node, children in pending:
+            compiled.first_child[node] = len(compiled.feature)
+            compiled.num_children[node] = len(children)
+            for key, child in children.items():
+                if type(child) == dict:
+                    pending.append((compiled.add_node(self.feature_ids[key]), child))
+                else:
+                    compiled.add_node(-1, child)
+        return compiled
+
+    #returns every combination of feature branches, one per row
+    def feature_domain(self) -> np.ndarray:
+        return np.array(list(product(*[range(self.num_of_branch[name]) for name in self.funcs])))
+
+    #generate decision from a compiled tree and game state object
+    def evaluate(self, compiled: CompiledTree, state):
+        feature = compiled.feature
+        funcs = self.feature_funcs
+        node = 0
+        while feature[node] >= 0:
+            index = funcs[feature[node]](state)
+            if index >= compiled.num_children[node]:
+                raise IndexError('branch ' + str(index) + ' of a node with ' + str(compiled.num_children[node]) + ' children')
+            node = compiled.first_child[node] + index
+        return compiled.leaf[node]
     
     #extract tree from jason 
     def tree_from_json(self, data):
@@ -149,12 +265,12 @@ class Tree():
             avaliable = [a for a in params +
                          used_params if a not in used_params]
             # terminate if by chance or if all params have been used
-            if random.random() > spliting_chance or avaliable == []:
-                dct["option_"+str(splits)] = random.random() < 0.5
+            if self.rng.random() > spliting_chance or avaliable == []:
+                dct["option_"+str(splits)] = self.rng.random() < 0.5
             # keep splitting
             else:
                 # select a
-                this_param = random.choice(avaliable)
+                this_param = self.rng.choice(avaliable)
                 used_params.append(this_param)
                 dct[this_param] = self.generate_vote_betray_tree(
                     params, used_params, self.num_of_branch[this_param], spliting_chance*split_decrease_rate,split_decrease_rate)
@@ -169,14 +285,14 @@ class Tree():
             avaliable = [a for a in params +
                          used_params if a not in used_params]
             # terminate if by chance or if all params have been used
-            if random.random() > spliting_chance or avaliable == []:
-                principle = random.choice(self.propose_option)
+            if self.rng.random() > spliting_chance or avaliable == []:
+                principle = self.rng.choice(self.propose_option)
                 #select 
                 dct["option_"+str(splits)] = principle
             # keep splitting
             else:
                 # select a
-                this_param = random.choice(avaliable)
+                this_param = self.rng.choice(avaliable)
                 used_params.append(this_param)
                 dct[this_param] = self.generate_propose_tree(
                     params, used_params, self.num_of_branch[this_param], spliting_chance*split_decrease_rate,split_decrease_rate)
@@ -187,15 +303,15 @@ class Tree():
     def generate_mutated_tree(self,tree,type_of_tree,mutate_rate):
         if type_of_tree == "VOTE" or type_of_tree == "BETRAY":
             for key in tree:
-                if random.random()<mutate_rate and type(tree[key])!= dict:
+                if self.rng.random()<mutate_rate and type(tree[key])!= dict:
                     tree[key] = not tree[key]
                 elif  type(tree[key]) == dict:
                     tree[key] = self.generate_mutated_tree(tree[key],"VOTE",mutate_rate)
             return tree
         else:
             for key in tree:
-                if random.random()<mutate_rate and type(tree[key])!= dict:
-                    tree[key] = random.choice(self.propose_option)
+                if self.rng.random()<mutate_rate and type(tree[key])!= dict:
+                    tree[key] = self.rng.choice(self.propose_option)
                 elif  type(tree[key]) == dict:
                     tree[key] = self.generate_mutated_tree(tree[key],"PROPOSE",mutate_rate)
             return tree
@@ -211,7 +327,7 @@ class Tree():
             select_rate = 1
         for key in tree_a:
             #keep searching
-            if random.random() > select_rate:
+            if self.rng.random() > select_rate:
                 if type(tree_a[key]) == dict:
                     seen = [param for param in tree_a if type(tree_a[key]) == dict]
                     seen = list(np.append(seen,existing_node))
@@ -256,13 +372,13 @@ class Tree():
     #generate random decision tree of type vote, betray or propose
     def generate_tree(self,type):
         if type == "VOTE" or type == "BETRAY":
-            initial = random.choice(self.vote_betray_param)
+            initial = self.rng.choice(self.vote_betray_param)
             tree = {
                 initial: self.generate_vote_betray_tree(self.vote_betray_param, [initial], self.num_of_branch[initial], 0.9,0.7)
             }
             return tree
         else:
-            initial = random.choice(self.propose_param)
+            initial = self.rng.choice(self.propose_param)
             tree = {
                 initial: self.generate_propose_tree(self.propose_param, [initial], self.num_of_branch[initial], 0.9,0.7)
             }
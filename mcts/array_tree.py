@@ -0,0 +1,170 @@
+'''
+An ISMCTS tree for monte_high_bf.Monte that keeps its nodes in preallocated numpy arrays
+rather than as Node and SimultaneousMoveNode objects, so a search allocates (almost) no
+Python objects per node. Node i is row i of every array, and node 0 is the root.
+Actions are given integer ids the first time they are seen, and the child reached by an action
+is looked up with the integer key (node << 32 | action id).
+The arrays double in size whenever they are full.
+'''
+
+import numpy as np
+from math import sqrt, log
+
+
+class ArrayTree:
+    MAX_PLAYERS = 10
+
+    def __init__(self, root_player, capacity=1024):
+        self.capacity = capacity
+        self.size = 0
+        self.parent = np.full(capacity, -1, dtype=np.int32)         # Parent index. -1 for the root.
+        self.action_id = np.full(capacity, -1, dtype=np.int32)      # Id of the action the parent took to reach the node
+        self.reward = np.zeros(capacity)                            # MCTS reward during backpropagation
+        self.visits = np.zeros(capacity, dtype=np.int64)            # MCTS visits during backpropagation
+        self.avails = np.zeros(capacity, dtype=np.int64)            # Number of times the node was available for selection
+        self.choice_reward = np.zeros((capacity, self.MAX_PLAYERS, 2))                   # DUCT statistics of simultaneous moves, indexed by
+        self.choice_visits = np.zeros((capacity, self.MAX_PLAYERS, 2), dtype=np.int64)   # [node, position of player in node's players, choice]
+        self.players = []                   # Player (int) or players (tuple) to move at each node
+        self.actions = []                   # Action for each action id
+        self.action_ids = {}                # {action: action id, ...}
+        self.children = {}                  # {node << 32 | action id: child, ...}
+        self.child_list = []                # Children of each node, so a node's children are found without scanning children
+        self.root = self.add_node(root_player, -1, -1)
+
+
+    def add_node(self, player, parent, action_id):
+        if self.size == self.capacity:
+            self.grow()
+        node = self.size
+        self.size += 1
+        self.parent[node] = parent
+        self.action_id[node] = action_id
+        self.players.append(player)
+        self.child_list.append([])
+        return node
+
+
+    def grow(self):
+        def double(a):
+            grown = np.zeros((2 * self.capacity,) + a.shape[1:], dtype=a.dtype)
+            grown[:self.capacity] = a
+            return grown
+
+        self.parent = double(self.parent)
+        self.action_id = double(self.action_id)
+        self.reward = double(self.reward)
+        self.visits = double(self.visits)
+        self.avails = double(self.avails)
+        self.choice_reward = double(self.choice_reward)
+        self.choice_visits = double(self.choice_visits)
+        self.capacity *= 2
+
+
+    def child(self, node, action):
+        aid = self.action_ids.get(action)
+        if aid is None:
+            return -1
+        return self.children.get(node << 32 | aid, -1)
+
+
+    def action(self, node):
+        return self.actions[self.action_id[node]]
+
+
+    def player(self, node):
+        return self.players[node]
+
+
+    # A simultaneous move is never left for expansion, the child of a joint action is made when DUCT first chooses it
+    def unexplored_actions(self, node, possible_actions):
+        if type(self.players[node]) == tuple:
+            return []
+        return [a for a in possible_actions if self.child(node, a) < 0]
+
+
+    # state is only used by a NodeTree with a transposition table, an ArrayTree does not share states
+    def append_child(self, node, next_player, action, state=None):
+        aid = self.action_ids.get(action)
+        if aid is None:
+            aid = len(self.actions)
+            self.action_ids[action] = aid
+            self.actions.append(action)
+        child = self.add_node(next_player, node, aid)
+        self.children[node << 32 | aid] = child
+        self.child_list[node].append(child)
+        return child
+
+
+    # Chooses the child of node to descend to, makes its action on state and returns it, see NodeTree.ucb_selection
+    def ucb_selection(self, node, possible_actions, exploration, state):
+        if type(self.players[node]) == tuple:
+            joint_action = possible_actions[self.duct_selection(node, exploration)]
+            state.make_move(joint_action)
+            child = self.child(node, joint_action)
+            return child if child >= 0 else self.append_child(node, state.player, joint_action, state)
+
+        legal_children = np.array([c for c in (self.child(node, a) for a in possible_actions) if c >= 0])
+        self.avails[legal_children] += 1
+        visits = self.visits[legal_children]
+        ucb = self.reward[legal_children] / visits + exploration * np.sqrt(np.log(self.avails[legal_children]) / visits)
+        child = int(legal_children[np.argmax(ucb)])
+        state.make_move(self.action(child))
+        return child
+
+
+    # Decoupled UCT selection, see SimultaneousMoveNode.duct_selection. Returns the joint index of the chosen joint action,
+    # with the choice of the i-th moving player in bit i, trying each player's untried choice first
+    def duct_selection(self, node, exploration):
+        rewards = self.choice_reward[node].tolist()
+        visits = self.choice_visits[node].tolist()
+        joint_index = 0
+        for i in range(len(self.players[node])):
+            total_visits = visits[i][0] + visits[i][1]
+            ucb = lambda c: float('inf') if visits[i][c] == 0 else \
+                rewards[i][c] / visits[i][c] + exploration * sqrt(log(total_visits) / visits[i][c])
+            if ucb(1) >= ucb(0):
+                joint_index |= 1 << i
+        return joint_index
+
+
+    def backpropagate(self, path, terminal_state):
+        rewards = []
+        for i, node in enumerate(path):
+            player_just_moved = self.players[path[i - 1]] if i > 0 else None
+            rewards.append(terminal_state.game_result(player_just_moved) if type(player_just_moved) == int else 0)
+
+            # update the DUCT statistics of the joint action taken from a simultaneous move
+            players = self.players[node]
+            if type(players) == tuple and i + 1 < len(path):
+                joint_action = self.action(path[i + 1]).value
+                for slot, p in enumerate(players):
+                    choice = joint_action >> p & 1
+                    self.choice_reward[node, slot, choice] += terminal_state.game_result(p)
+                    self.choice_visits[node, slot, choice] += 1
+
+        self.reward[path] += rewards
+        self.visits[path] += 1
+
+
+    def best_action(self):
+        best = max(self.child_list[self.root], key=lambda c: self.visits[c])
+        return self.action(best)
+
+
+    def root_summary(self):
+        summary = {}
+        for c in self.child_list[self.root]:
+            a = self.action(c)
+            summary[(a.value, a.player)] = (int(self.visits[c]), float(self.reward[c]))
+        return summary
+
+
+    # Makes the only child of the root whose action satisfies matches the new root.
+    # The rows of the rest of the old tree are not reclaimed, so the tree keeps growing until it is replaced.
+    def descend(self, matches):
+        children = [c for c in self.child_list[self.root] if matches(self.action(c))]
+        if len(children) != 1:
+            return False
+        self.root = children[0]
+        self.parent[self.root] = -1
+        return True
@@ -0,0 +1,112 @@
+import numpy as np
+from math import comb
+
+
+'''
+A simple model of how the other players act, given who the spies are, used to weigh
+the worlds (determinations) a resistance player believes possible.
+- A spy votes for a team with a spy on it with probability spy_for_spy_team, and for a team
+  without one with probability spy_for_clean_team. A resistance player votes for a team it is on
+  with probability resistance_for_own_team, and for other teams with probability resistance_for_other_team.
+- A spy leader proposes a team with a spy on it with probability spy_leader_spy_team, a resistance leader
+  with probability resistance_leader_spy_team (about that of a random team).
+- Each spy on a mission sabotages it with probability betray.
+The model is only a rough guess at how opponents play, so the weight of its evidence is tempered by
+raising every likelihood to the power temperature (1 for full Bayesian updates, 0 to ignore the model).
+'''
+class OpponentModel:
+    def __init__(self, spy_for_spy_team=0.9, spy_for_clean_team=0.3, resistance_for_own_team=0.9,
+        resistance_for_other_team=0.6, spy_leader_spy_team=0.9, resistance_leader_spy_team=0.5, betray=0.8, temperature=0.5):
+        self.spy_for_spy_team = spy_for_spy_team
+        self.spy_for_clean_team = spy_for_clean_team
+        self.resistance_for_own_team = resistance_for_own_team
+        self.resistance_for_other_team = resistance_for_other_team
+        self.spy_leader_spy_team = spy_leader_spy_team
+        self.resistance_leader_spy_team = resistance_leader_spy_team
+        self.betray = betray
+        self.temperature = temperature
+
+
+'''
+The posterior over every world a resistance player started the game with, as log weights in a numpy array,
+so each observation updates all C(n-1, k) worlds at once. Worlds that contradict a sabotage count
+(more sabotages than spies on the mission) have a log weight of -inf and are no longer live.
+If the model rules out every world, the belief falls back to uniform over the worlds the sabotages allow.
+observe_* are called by the agent with what the game tells it, and live() gives the worlds to sample from.
+'''
+class BayesianBelief:
+    MAX_SPIES = 4
+
+    def __init__(self, worlds, num_players, player, model=None):
+        self.num_players = num_players
+        self.player = player                                            # The player who holds the belief, never a spy
+        self.model = model if model is not None else OpponentModel()
+        self.worlds = np.array(worlds, dtype=np.int64)                  # Bitmask of the spies in each world
+        self.log_weights = np.zeros(len(self.worlds))
+        self.legal = np.ones(len(self.worlds), dtype=bool)              # Worlds consistent with every sabotage count
+        self.is_spy = (self.worlds[:, None] >> np.arange(num_players) & 1).astype(bool)     # [world, player]
+
+
+    # Number of spies on the team in each world
+    def spies_on(self, team):
+        return self.is_spy[:, list(team)].sum(axis=1)
+
+
+    # Adds the tempered log likelihood of an observation in each world. Worlds where it is impossible are ruled out.
+    # Once no world is left the model has been contradicted, so its evidence is dropped and every legal world is equally likely
+    def update(self, likelihood):
+        with np.errstate(divide='ignore'):
+            self.log_weights += np.where(likelihood > 0, self.model.temperature * np.log(likelihood), -np.inf)
+        if not np.isfinite(self.log_weights).any():
+            self.log_weights = np.where(self.legal, 0.0, -np.inf)
+
+
+    def observe_proposal(self, team, leader):
+        if leader == self.player:
+            return
+        model = self.model
+        spy_team = self.spies_on(team) > 0
+        spy_team_prob = np.where(self.is_spy[:, leader], model.spy_leader_spy_team, model.resistance_leader_spy_team)
+        self.update(np.where(spy_team, spy_team_prob, 1 - spy_team_prob))
+
+
+    def observe_votes(self, team, votes_for):
+        model = self.model
+        spy_team = (self.spies_on(team) > 0)[:, None]
+        on_team = np.zeros(self.num_players, dtype=bool)
+        on_team[list(team)] = True
+        voted_for = np.zeros(self.num_players, dtype=bool)
+        voted_for[list(votes_for)] = True
+
+        # Probability that each player votes for the team in each world, [world, player]
+        for_prob = np.where(self.is_spy,
+            np.where(spy_team, model.spy_for_spy_team, model.spy_for_clean_team),
+            np.where(on_team, model.resistance_for_own_team, model.resistance_for_other_team))
+        likelihood = np.where(voted_for, for_prob, 1 - for_prob)
+        likelihood[:, self.player] = 1
+        self.update(likelihood.prod(axis=1))
+
+
+    def observe_sabotages(self, team, num_fails):
+        betray = self.model.betray
+        # P(num_fails | s spies on the team) for s = 0 .. MAX_SPIES, 0 if there are too few spies
+        fail_prob = np.array([comb(s, num_fails) * betray ** num_fails * (1 - betray) ** (s - num_fails) if num_fails <= s else 0
+            for s in range(self.MAX_SPIES + 1)])
+        spies_on_team = self.spies_on(team)
+        self.legal &= spies_on_team >= num_fails
+        self.update(fail_prob[spies_on_team])
+
+
+    # Returns the live worlds and their weights, normalised so the most likely world has weight 1
+    def live(self):
+        live = np.isfinite(self.log_weights)
+        weights = np.exp(self.log_weights[live] - self.log_weights[live].max())
+        return self.worlds[live].tolist(), weights.tolist()
+
+
+    # Returns the probability of each of the starting worlds
+    def probabilities(self):
+        with np.errstate(invalid='ignore'):
+            weights = np.exp(self.log_weights - self.log_weights.max())
+        return weights / weights.sum()
+
@@ -1,21 +1,81 @@
 import random
 import time
+import copy
+from collections import OrderedDict
 from agent import Agent
-from itertools import combinations, product
+from mcts.rewards import MarginReward
+from itertools import combinations, accumulate
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 
 MAX_TIME = 0.350
 
+'''
+Limits an ISMCTS search to a number of seconds, a number of iterations, or whichever comes first
+when both are given. A limit of None means no limit of that kind.
+'''
+class SearchBudget():
+    def __init__(self, max_time=MAX_TIME, max_iterations=None):
+        if max_time is None and max_iterations is None:
+            raise ValueError('A search budget needs a time or iteration limit')
+        self.max_time = max_time
+        self.max_iterations = max_iterations
+
+
+    def exhausted(self, elapsed, iterations):
+        return (self.max_time is not None and elapsed >= self.max_time) or \
+               (self.max_iterations is not None and iterations >= self.max_iterations)
+
+
+    # Fraction of the budget used so far, between 0 and 1
+    def progress(self, elapsed, iterations):
+        progress = 0
+        if self.max_time is not None:
+            progress = elapsed / self.max_time
+        if self.max_iterations is not None:
+            progress = max(progress, iterations / self.max_iterations)
+        return min(progress, 1)
+
+
 class Monte(Agent):
 
-    def __init__(self, name):
+    def __init__(self, name, use_array_tree=False, budget=None, on_progress=None, progress_interval=100, reuse_tree=True, num_workers=1,
+        belief_model=None, transposition_size=None, reward_model=None):
         '''
         Initialises the agent, and gives it a name
         You can add configuration parameters etc here,
         but the default code will always assume a 1-parameter constructor, which is the agent's name.
         The agent will persist between games to allow for long-term learning etc.
+        use_array_tree stores the search tree in numpy arrays (see mcts/array_tree.py) instead of Node objects.
+        budget is the SearchBudget of each decision, MAX_TIME seconds by default.
+        on_progress(iterations, best_action) is called every progress_interval iterations of a search
+        with the action the search would return if it stopped there.
+        reuse_tree keeps the search tree between decisions, moving its root along the observed actions,
+        so a decision that follows the previous one starts from the statistics already gathered for it.
+        num_workers > 1 runs every search root parallel in that many worker processes (see search),
+        in which case trees are not reused and on_progress is not called.
+        belief_model is an optional mcts.belief.OpponentModel. With it, a resistance agent also weighs its
+        determinations by how likely the observed proposals, votes and sabotages are in each of them,
+        and samples them by weight rather than uniformly.
+        reward_model scores the end of each playout (see mcts/rewards.py), MarginReward by default.
+        transposition_size is the number of states kept in a TranspositionTable of the search tree,
+        so a state reached by different paths shares its subtree. None (the default) turns it off.
+        It is only used by the Node tree, not the array tree.
         '''
         self.name = name
+        self.use_array_tree = use_array_tree
+        self.budget = budget if budget is not None else SearchBudget(MAX_TIME)
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.reuse_tree = reuse_tree
+        self.num_workers = num_workers
+        self.belief_model = belief_model
+        self.reward_model = reward_model if reward_model is not None else MarginReward()
+        self.transposition_size = transposition_size
+        self.executor = None                # Process pool of a root parallel search, started on its first search
+        self.tree = None
+        self.iterations = 0                 # Number of ISMCTS iterations in the last search
 
 
     def __str__(self):
@@ -46,15 +106,20 @@ class Monte(Agent):
         self.player = player_number
         self.num_players = number_of_players
         if self.is_spy:
-            d = tuple([True if p in spies else False for p in range(number_of_players)])
-            self.determinations = [d]
+            self.determinations = [to_mask(spies)]
         else:
             self.determinations = initialise_determinations(self.player, self.num_players)
+        self.cum_weights = None             # Cumulative weights of the determinations, None if they are equally likely
+        self.updater = None                 # BayesianBelief of a resistance agent with a belief_model
+        if self.belief_model is not None and not self.is_spy:
+            from mcts.belief import BayesianBelief
+            self.updater = BayesianBelief(self.determinations, self.num_players, self.player, self.belief_model)
 
         self.rnd = 0
         self.missions_succeeded = 0
         self.mission = []
         self.num_selection_fails = 0
+        self.tree = None
 
 
     def propose_mission(self, team_size, fails_required = 1):
@@ -66,10 +131,8 @@ class Monte(Agent):
         self.leader = self.player
         self.state_name = StateNames.SELECTION
 
-        self.root_node = Node(self.player)
-
-        selected_node = self.ISMCTS(MAX_TIME, self.player)
-        mission = list(selected_node.action.value)
+        action_value = self.search(self.player)
+        mission = list(MASK_PLAYERS[action_value])
         return mission
 
 
@@ -84,11 +147,11 @@ class Monte(Agent):
         self.state_name = StateNames.VOTING
         self.mission = mission
 
-        self.root_node = SimultaneousMoveNode(range(self.num_players))
-        
-        selected_node = self.ISMCTS(MAX_TIME, range(self.num_players))
-        joint_action = selected_node.action.value
-        self_action, = [a for p, a in joint_action if p == self.player]
+        if self.tree is not None and self.tree.player(self.tree.root) == proposer:
+            mission_mask = to_mask(mission)
+            self.follow(lambda a: a.src_type == StateNames.SELECTION and a.value == mission_mask)
+        joint_action = self.search(tuple(range(self.num_players)))
+        self_action = bool(joint_action >> self.player & 1)
         return self_action
 
 
@@ -100,11 +163,30 @@ class Monte(Agent):
         votes is a dictionary mapping player indexes to Booleans (True if they voted for the mission, False otherwise).
         No return value is required or expected.
         '''
-        num_votes_for = sum(votes)
-        if num_votes_for * 2 < self.num_players:
+        if self.updater is not None:
+            self.updater.observe_proposal(mission, proposer)
+            self.updater.observe_votes(mission, votes)
+            self.reweight()
+        num_votes_for = len(votes)
+        if num_votes_for * 2 <= self.num_players:
             self.num_selection_fails += 1
+            next_player = None
         else:
             self.num_selection_fails = 0
+            # the players of the sabotage that follows are only known if every world agrees on the spies in the mission
+            spies_in_mission = {d & to_mask(mission) for d in self.determinations}
+            if len(spies_in_mission) > 1:
+                self.tree = None
+                return
+            spies_in_mission = spies_in_mission.pop()
+            if spies_in_mission:
+                next_player = MASK_PLAYERS[spies_in_mission]
+            else:
+                next_player = (proposer + 1) % self.num_players if self.rnd < 4 else -1
+
+        votes_mask = to_mask(votes)
+        self.follow(lambda a: a.src_type == StateNames.VOTING and a.value == votes_mask and 
+            (next_player is None or a.player == next_player))
 
 
     def betray(self, mission, proposer):
@@ -118,13 +200,10 @@ class Monte(Agent):
         self.leader = proposer
         self.state_name = StateNames.SABOTAGE
         self.mission = mission
-        spies_in_mission = tuple([s for s in self.spies if s in self.mission])
-
-        self.root_node = SimultaneousMoveNode(spies_in_mission)
+        spies_in_mission = MASK_PLAYERS[to_mask(self.spies) & to_mask(self.mission)]
 
-        selected_node = self.ISMCTS(MAX_TIME, spies_in_mission)
-        joint_action = selected_node.action.value
-        self_action, = [a for p, a in joint_action if p == self.player]
+        joint_action = self.search(spies_in_mission)
+        self_action = bool(joint_action >> self.player & 1)
         return self_action
 
 
@@ -137,11 +216,16 @@ class Monte(Agent):
         and mission_success is True if there were not enough betrayals to cause the mission to fail, False otherwise.
         It iss not expected or required for this function to return anything.
         '''
+        if self.tree is not None and type(self.tree.player(self.tree.root)) == tuple:
+            self.follow(lambda a: a.src_type == StateNames.SABOTAGE and POPCOUNT[a.value] == num_fails)
         if num_fails < Agent.fails_required[self.num_players][self.rnd]:
             self.missions_succeeded += 1 
         self.rnd += 1 
         if not self.is_spy:
             self.remove_illegal_worlds(num_fails, mission)
+        if self.updater is not None:
+            self.updater.observe_sabotages(mission, num_fails)
+            self.reweight()
 
 
     def round_outcome(self, rounds_complete, missions_failed):
@@ -150,6 +234,8 @@ class Monte(Agent):
         rounds_complete, the number of rounds (0-5) that have been completed
         missions_failed, the numbe of missions (0-3) that have failed.
         '''
+        if self.num_selection_fails > 0:    # the round ended with five rejected teams, which the search tree does not model
+            self.tree = None
         self.rnd = rounds_complete
         self.missions_succeeded = rounds_complete - missions_failed
         self.num_selection_fails = 0
@@ -161,67 +247,168 @@ class Monte(Agent):
         spies_win, True iff the spies caused 3+ missions to fail
         spies, a list of the player indexes for the spies.
         '''
-        pass
+        self.tree = None
+
+
+    def search(self, root_player):
+        '''
+        runs ISMCTS for the decision of root_player and returns the value of the chosen action.
+        With num_workers > 1 the search is root parallel: each worker process searches its own tree
+        from the same state for the whole budget, and the action with the most visits over all trees is chosen.
+        '''
+        if self.num_workers > 1:
+            return self.parallel_search(root_player)
+        self.tree = self.next_tree(root_player)
+        return self.ISMCTS(self.budget, root_player).value
+
+
+    def parallel_search(self, root_player):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        inputs = {name: getattr(self, name) for name in SEARCH_INPUTS}
+        futures = [self.executor.submit(root_search, inputs, root_player, self.use_array_tree, self.budget, self.rng.getrandbits(64),
+            self.transposition_size) for _ in range(self.num_workers)]
+        results = [future.result() for future in futures]
+
+        self.iterations = sum(iterations for _, iterations in results)
+        children = merge_summaries([summary for summary, _ in results])
+        return max(children, key=lambda key: children[key][0])[0]
 
 
-    def ISMCTS(self, max_time, current_player, use_simulated_annealing=True):
+    def close(self):
+        '''
+        shuts down the worker processes of root parallel searches
+        '''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+    def new_tree(self, player):
+        '''
+        returns an empty search tree whose root is a decision for player,
+        which is a tuple of players for a simultaneous move
+        '''
+        if self.use_array_tree:
+            from mcts.array_tree import ArrayTree
+            return ArrayTree(player)
+        table = None if self.transposition_size is None else TranspositionTable(self.transposition_size)
+        if type(player) == tuple:
+            return NodeTree(SimultaneousMoveNode(player), table)
+        return NodeTree(Node(player), table)
+
+
+    def next_tree(self, player):
+        '''
+        returns the tree to search for a decision of player,
+        which is the kept tree if its root is already that decision, or a new tree otherwise
+        '''
+        if self.reuse_tree and self.tree is not None and self.tree.player(self.tree.root) == player:
+            return self.tree
+        return self.new_tree(player)
+
+
+    def follow(self, matches):
+        '''
+        moves the root of the kept tree to the child reached by the observed action,
+        the only child whose action satisfies matches, or drops the tree if there is no such child
+        '''
+        if self.tree is not None and not self.tree.descend(matches):
+            self.tree = None
+
+
+    def ISMCTS(self, budget, current_player, use_simulated_annealing=True):
         start_time = time.time()
         time_diff = 0
         it = 0
-        while (time_diff < max_time):
+        mission = to_mask(self.mission)
+        while not budget.exhausted(time_diff, it):
             it += 1
             # determinize
-            determination = random.choice(self.determinations)
-            state = ResistanceState(determination, self.leader, current_player, self.state_name, self.rnd,
-                self.missions_succeeded, self.mission, self.num_selection_fails)
+            if self.cum_weights is None:
+                determination = self.rng.choice(self.determinations)
+            else:
+                determination = self.rng.choices(self.determinations, cum_weights=self.cum_weights)[0]
+            state = ResistanceState(self.num_players, determination, self.leader, current_player, self.state_name, self.rnd,
+                self.missions_succeeded, mission, self.num_selection_fails)
 
-            temperature = min(0.8, (1 - time_diff / MAX_TIME))
+            temperature = min(0.8, (1 - budget.progress(time_diff, it - 1)))
             exploration = temperature if use_simulated_annealing else 0.7
 
             # selection
-            node = self.root_node
+            tree = self.tree
+            node = tree.root
+            path = [node]
             moves = state.get_moves()
-            while moves != [] and node.unexplored_actions(moves) == []: 
-                node = node.ucb_selection(moves, exploration)
-                state.make_move(node.action)
+            while moves and tree.unexplored_actions(node, moves) == []: 
+                node = tree.ucb_selection(node, moves, exploration, state)
+                path.append(node)
                 moves = state.get_moves()
 
             # expansion
-            if moves != []:    # if node is non-terminal
-                unexplored_actions = node.unexplored_actions(moves)
-                action = random.choice(unexplored_actions)
+            if moves:    # if node is non-terminal
+                unexplored_actions = tree.unexplored_actions(node, moves)
+                action = self.rng.choice(unexplored_actions)
                 state.make_move(action)
-                node = node.append_child(state.player, action)
+                node = tree.append_child(node, state.player, action, state)
+                path.append(node)
 
             # playout
-            terminal_state = playout(state)
+            terminal_state = playout(state, self.rng)
+            terminal_state.score(self.reward_model)
             
             # backpropagation
-            child = node.backpropagate(terminal_state)
-            while (node != self.root_node):   # backpropagate to root node
-                node = node.parent
-                child = node.backpropagate(terminal_state, child)
+            tree.backpropagate(path, terminal_state)
             
             time_diff = time.time() - start_time
+            if self.on_progress is not None and it % self.progress_interval == 0:
+                self.on_progress(it, tree.best_action())
             
-        return max(self.root_node.children.values(), key=lambda c: c.visits)  
+        self.iterations = it
+        return tree.best_action()
 
 
     def remove_illegal_worlds(self, num_sabotages, mission):
-        for d in self.determinations:
-            num_players = len(d)
-            spies = [p for p in range(num_players) if d[p]]
-            spies_in_mission = [s for s in spies if s in mission]
-            if num_sabotages > len(spies_in_mission):
-                self.determinations.remove(d)
+        mission = to_mask(mission)
+        self.determinations = [d for d in self.determinations if POPCOUNT[d & mission] >= num_sabotages]
+
+
+    # Replaces the determinations with the live worlds of the belief updater, and their weights
+    def reweight(self):
+        self.determinations, weights = self.updater.live()
+        self.cum_weights = list(accumulate(weights))
 
 
-def playout(state):
-    moves = state.get_moves()
-    while moves != []:
-        state.make_move(random.choice(moves))
-        moves = state.get_moves()
-    return state       
+def playout(state, rng=random):
+    return state.playout(rng)
+
+
+# Attributes of Monte that a root parallel worker needs to rebuild the state of a search
+SEARCH_INPUTS = ('num_players', 'player', 'determinations', 'cum_weights', 'reward_model', 'leader', 'state_name', 'rnd', 'missions_succeeded', 
+    'mission', 'num_selection_fails')
+
+
+# Runs one tree of a root parallel search in a worker process.
+# Returns the root summary of the tree and the number of iterations.
+def root_search(inputs, root_player, use_array_tree, budget, seed, transposition_size=None):
+    searcher = Monte('root search', use_array_tree, budget, reuse_tree=False, transposition_size=transposition_size)
+    for name, value in inputs.items():
+        setattr(searcher, name, value)
+    searcher.set_rng(random.Random(seed))
+    searcher.tree = searcher.new_tree(root_player)
+    searcher.ISMCTS(budget, root_player)
+    return searcher.tree.root_summary(), searcher.iterations
+
+
+# Adds up the root summaries of several trees.
+# Children are keyed by (action value, next player) rather than by Action, whose hash differs between processes.
+def merge_summaries(summaries):
+    merged = {}
+    for summary in summaries:
+        for key, (visits, reward) in summary.items():
+            total_visits, total_reward = merged.get(key, (0, 0))
+            merged[key] = (total_visits + visits, total_reward + reward)
+    return merged
 
 
 def initialise_determinations(player, num_players):
@@ -230,9 +417,31 @@ def initialise_determinations(player, num_players):
     spy_configurations = list(combinations(possible_spies, num_spies))
     determinations = []
     for spies in spy_configurations:
-        d = tuple([True if p in spies else False for p in range(num_players)])
-        determinations.append(d)
+        determinations.append(to_mask(spies))
     return determinations    
+
+
+# Returns the bitmask with bit p set for each player p in players
+def to_mask(players):
+    mask = 0
+    for p in players:
+        mask |= 1 << p
+    return mask
+
+
+# Returns the bitmasks of every team of mission_size players, built once for each game size and team size
+def team_masks(num_players, mission_size):
+    key = (num_players, mission_size)
+    if key not in TEAM_MASKS:
+        TEAM_MASKS[key] = tuple(to_mask(team) for team in combinations(range(num_players), mission_size))
+    return TEAM_MASKS[key]
+
+
+TEAM_MASKS = {}
+# Determinations, teams and votes are bitmasks over at most 10 players, where bit p is player p.
+# POPCOUNT[mask] is the number of players in mask and MASK_PLAYERS[mask] the tuple of players in mask.
+POPCOUNT = tuple(bin(mask).count('1') for mask in range(1 << 10))
+MASK_PLAYERS = tuple(tuple(p for p in range(10) if mask >> p & 1) for mask in range(1 << 10))
     
     
     
@@ -244,6 +453,19 @@ class Roles():
     NON_SPY = 'RESISTANCE'
 
 
+'''
+Tables of possible actions are shared by every state with the same key (see ResistanceState.get_moves and action_table).
+Besides the state name and round, the actions depend on which spies are in the mission (the next players
+of a sabotage) and on the leader and number of rejected teams (the next player, or the end of the round).
+The tables of team selections are built when the module is imported, for every game size.
+There are too many voting and sabotage keys to build them all, so those tables are built the first time
+their key is seen and kept in a least recently used cache of ACTION_TABLE_SIZE tables. A voting table of 10 players
+has 1024 actions (about 150 KB), so the cache takes at most about 150 MB, and much less in practice.
+Each process has its own cache; the workers of a root parallel search live as long as the agent, so they keep theirs.
+'''
+ACTION_TABLE_SIZE = 1024
+
+
 class StateNames():
     SELECTION = 'MISSION SELECTION'
     VOTING = 'VOTING'
@@ -255,6 +477,8 @@ class StateNames():
 A class to encapsulate information relevant to an action
 '''
 class Action():
+    __slots__ = ('src_type', 'dst_type', 'player', 'value', 'is_simultaneous', 'hash')
+
     def __init__(self, src_type, dst_type, player, value):
         self.src_type = src_type
         self.dst_type = dst_type
@@ -263,10 +487,11 @@ class Action():
         self.is_simultaneous = False
         if src_type == StateNames.SABOTAGE or src_type == StateNames.VOTING:
             self.is_simultaneous = True
+        self.hash = hash((self.src_type, self.dst_type, self.player, self.value))   # Actions are shared and never change, so hash once
 
 
     def __hash__(self):
-        return hash((self.src_type, self.dst_type, self.player, self.value))
+        return self.hash
 
 
     def __eq__(self, other):
@@ -283,40 +508,56 @@ A class used to define a perfect information representation of a game state in
 Avalon Resistance, including methods to get all moves and apply moves.
 '''
 class ResistanceState():
-    def __init__(self, determination, leader, player, state_name, rnd, 
-        missions_succeeded, mission=[], num_selection_fails=0):
+    def __init__(self, num_players, determination, leader, player, state_name, rnd, 
+        missions_succeeded, mission=0, num_selection_fails=0):
+        self.num_players = num_players
         self.leader = leader                                    # Stores the player_id of the last leader (current leader if in SELECTION state)
         self.player = player                                    # Current player/players in the state. -1 for a terminal state.  
-        self.determination = determination                      # Array of booleans such that player 'p_id' is a spy if determination[p_id] = True
+        self.determination = determination                      # Bitmask such that player 'p_id' is a spy if bit p_id is set
         self.state_name = state_name                            # Defines the current game state (SELECTION, VOTING, SABOTAGE or TERMINAL)
         self.rnd = rnd       
         self.missions_succeeded = missions_succeeded 
-        self.mission = mission                                
+        self.mission = mission                                  # Bitmask of the players in the mission
         self.num_selection_fails = num_selection_fails          # Number of times a team has been rejected in the same round (max 5)  
+        self.num_moves = 0                                      # Number of moves made from the initial state
+        self.rewards = None                                     # (resistance reward, spy reward) of a scored terminal state
 
 
-    # Returns all possible actions from this state => A(state)
+    # Returns all possible actions from this state => A(state), as a tuple shared by every state with the same key
     def get_moves(self):
+        num_players = self.num_players
+        if self.state_name == StateNames.SELECTION:
+            key = (num_players, self.rnd, self.state_name)
+        elif self.state_name == StateNames.VOTING:
+            key = (num_players, self.rnd, self.state_name, self.determination & self.mission, self.leader, self.num_selection_fails >= 5)
+        elif self.state_name == StateNames.SABOTAGE:
+            key = (num_players, self.rnd, self.state_name, self.determination & self.mission, self.leader)
+        else:
+            return ()
+
+        return action_table(key)
+
+
+    # Builds the list of possible actions from this state
+    def generate_moves(self):
         actions = []
-        num_players = len(self.determination)
+        num_players = self.num_players
 
         if self.state_name == StateNames.SELECTION:
             mission_size = Agent.mission_sizes[num_players][self.rnd]
             possible_missions = combinations(range(num_players), mission_size) 
-            action_vals = [tuple(mission) for mission in possible_missions]
+            action_vals = [to_mask(mission) for mission in possible_missions]
             actions = [self.generate_action(StateNames.SELECTION, val) for val in action_vals]
         
         elif self.state_name == StateNames.VOTING:
-            voting_combinations = product([False, True], repeat=num_players) 
-            action_vals = [tuple(enumerate(votes)) for votes in voting_combinations]
+            action_vals = range(1 << num_players)           # Bit p is set if player p votes for the mission
             actions = [self.generate_action(StateNames.VOTING, val) for val in action_vals]
 
+        # Joint actions are in the order of their joint index (see SimultaneousMoveNode.duct_selection):
+        # the action at index i has the choice of the j-th moving player in bit j of i
         elif self.state_name == StateNames.SABOTAGE:
-            spies = [p for p in range(num_players) if self.determination[p]]
-            spies_in_mission = [p for p in self.mission if p in spies]
-
-            sabotage_combinations = product((False, True), repeat=len(spies_in_mission))
-            action_vals = [tuple(zip(spies_in_mission, sabotages)) for sabotages in sabotage_combinations]
+            spies_in_mission = self.determination & self.mission
+            action_vals = [s for s in range(spies_in_mission + 1) if s & spies_in_mission == s]   # Bit p is set if spy p sabotages
             actions = [self.generate_action(StateNames.SABOTAGE, val) for val in action_vals]
         return actions
 
@@ -325,37 +566,34 @@ class ResistanceState():
         rnd = self.rnd
         dst_state = None
         player = None
-        num_players = len(self.determination)
-        spies = [p for p in range(num_players) if self.determination[p]]
+        num_players = self.num_players
 
         if src_state == StateNames.SELECTION:
             dst_state = StateNames.VOTING  
             player = tuple(range(num_players))                
 
         elif src_state == StateNames.VOTING:
-            spies_in_mission = tuple([p for p in self.mission if p in spies])
-            player_votes = action_val                       
-            votes = [vote for _, vote in player_votes]
-            num_votes_for = sum(votes)
+            spies_in_mission = self.determination & self.mission
+            num_votes_for = POPCOUNT[action_val]
 
-            if num_votes_for * 2 > len(votes):
+            if num_votes_for * 2 > num_players:
                 if spies_in_mission:
                     dst_state = StateNames.SABOTAGE
-                    player = spies_in_mission
+                    player = MASK_PLAYERS[spies_in_mission]
                 else:
                     dst_state = StateNames.SELECTION
-                    player = (self.leader + 1) % len(self.determination) 
+                    player = (self.leader + 1) % num_players 
                     rnd += 1
 
             else:
                 dst_state = StateNames.SELECTION
-                player = (self.leader + 1) % len(self.determination) 
+                player = (self.leader + 1) % num_players 
                 if self.num_selection_fails >= 5:
                     rnd += 1
 
         elif src_state == StateNames.SABOTAGE:
             dst_state = StateNames.SELECTION
-            player = (self.leader + 1) % len(self.determination) 
+            player = (self.leader + 1) % num_players 
             rnd += 1
         
         if rnd > 4:
@@ -367,70 +605,100 @@ class ResistanceState():
 
     # Changes the game state object into a new state s' where s' = s(move)
     def make_move(self, action):
-        num_players = len(self.determination)
-        spies = [p for p in range(num_players) if self.determination[p]]
-
         if action.src_type == StateNames.SELECTION:
-            self.state_name = StateNames.VOTING
-            self.player = tuple(range(num_players))
-            self.mission = action.value                         # Action is a list of player ids in the mission
-
+            self.select_mission(action.value)                   # Action is a bitmask of the players in the mission
         elif action.src_type == StateNames.VOTING:
-            spies_in_mission = tuple([p for p in self.mission if p in spies])
-            player_votes = action.value                         # Action has format ((p1, action1), (p2, action2), (p3, action3), ...)
-            votes = [vote for _, vote in player_votes]
-            num_votes_for = sum(votes)
+            self.apply_votes(POPCOUNT[action.value])    # Action is a bitmask of the players voting for the mission
+        elif action.src_type == StateNames.SABOTAGE:
+            self.apply_sabotages(POPCOUNT[action.value])    # Action is a bitmask of the spies sabotaging the mission
+
+
+    # Plays uniformly random moves until the game ends and returns the terminal state.
+    # Moves are sampled directly as team bitmasks and vote/sabotage counts, without building any actions.
+    def playout(self, rng=random):
+        num_players = self.num_players
+        while self.state_name != StateNames.TERMINAL:
+            if self.state_name == StateNames.SELECTION:
+                self.select_mission(rng.choice(team_masks(num_players, Agent.mission_sizes[num_players][self.rnd])))
+            elif self.state_name == StateNames.VOTING:
+                self.apply_votes(POPCOUNT[rng.getrandbits(num_players)])
+            else:
+                self.apply_sabotages(POPCOUNT[rng.getrandbits(len(self.player))])
+        return self
 
-            if num_votes_for * 2 > len(votes):
-                if spies_in_mission:
-                    self.state_name = StateNames.SABOTAGE
-                    self.player = spies_in_mission
-                else:
-                    self.state_name = StateNames.SELECTION
-                    self.leader = (self.leader + 1) % len(self.determination) 
-                    self.player = self.leader
-                    self.rnd += 1
-                    self.missions_succeeded += 1
-                self.num_selection_fails = 0
-
-            elif self.num_selection_fails < 5:
-                self.state_name = StateNames.SELECTION
-                self.leader = (self.leader + 1) % len(self.determination) 
-                self.player = self.leader
-                self.num_selection_fails += 1
 
+    def select_mission(self, mission):
+        self.num_moves += 1
+        self.state_name = StateNames.VOTING
+        self.player = tuple(range(self.num_players))
+        self.mission = mission
+
+
+    def apply_votes(self, num_votes_for):
+        self.num_moves += 1
+        num_players = self.num_players
+        spies_in_mission = self.determination & self.mission
+
+        if num_votes_for * 2 > num_players:
+            if spies_in_mission:
+                self.state_name = StateNames.SABOTAGE
+                self.player = MASK_PLAYERS[spies_in_mission]
             else:
                 self.state_name = StateNames.SELECTION
-                self.leader = (self.leader + 1) % len(self.determination) 
+                self.leader = (self.leader + 1) % num_players 
                 self.player = self.leader
-                self.num_selection_fails = 0
                 self.rnd += 1
-
-        elif action.src_type == StateNames.SABOTAGE:
-            num_fails_required = Agent.fails_required[num_players][self.rnd]
-            self.rnd += 1
-            _, sabotages = zip(*action.value)               # Action has format [(spy1, action1), (spy2, action2), ...]
-            num_sabotages = sum(sabotages)
-
-            if num_sabotages < num_fails_required:
                 self.missions_succeeded += 1
+            self.num_selection_fails = 0
 
+        elif self.num_selection_fails < 5:
+            self.state_name = StateNames.SELECTION
+            self.leader = (self.leader + 1) % num_players 
+            self.player = self.leader
+            self.num_selection_fails += 1
+
+        else:
             self.state_name = StateNames.SELECTION
-            self.leader = (self.leader + 1) % len(self.determination) 
+            self.leader = (self.leader + 1) % num_players 
             self.player = self.leader
+            self.num_selection_fails = 0
+            self.rnd += 1
+
+        if self.rnd > 4:
+            self.state_name = StateNames.TERMINAL
+
+
+    def apply_sabotages(self, num_sabotages):
+        self.num_moves += 1
+        num_fails_required = Agent.fails_required[self.num_players][self.rnd]
+        self.rnd += 1
+
+        if num_sabotages < num_fails_required:
+            self.missions_succeeded += 1
+
+        self.state_name = StateNames.SELECTION
+        self.leader = (self.leader + 1) % self.num_players 
+        self.player = self.leader
         
         if self.rnd > 4:
             self.state_name = StateNames.TERMINAL
 
 
-    # Returns the reward for a player based on the current determination stored in the state
+    # Returns the key of the state in a TranspositionTable. Two states with the same key have the same moves
+    # and outcomes for every determination, however they were reached. The mission only matters once a team is selected.
+    def key(self):
+        mission = 0 if self.state_name == StateNames.SELECTION else self.mission
+        return (self.rnd, self.missions_succeeded, self.num_selection_fails, self.leader, self.state_name, mission, self.player)
+
+
+    # Computes the reward of each role at a terminal state with reward_model, once for the whole backpropagation
+    def score(self, reward_model):
+        self.rewards = reward_model(self)
+
+
+    # Returns the reward for a player based on the current determination stored in the state, once it is scored
     def game_result(self, player):
-        num_fails = self.rnd - self.missions_succeeded
-        if self.determination[player]:  # player is a spy
-            score = num_fails - self.missions_succeeded
-        else:
-            score = self.missions_succeeded - num_fails
-        return score   
+        return self.rewards[self.determination >> player & 1]   
 
     
     def __repr__(self):
@@ -441,6 +709,31 @@ class ResistanceState():
         
            
         
+# Builds the actions of every state with the key (see ResistanceState.get_moves) from a stand-in state,
+# whose only spies are the spies in the mission
+@lru_cache(maxsize=ACTION_TABLE_SIZE)
+def action_table(key):
+    num_players, rnd, state_name = key[:3]
+    spies_in_mission, leader, rejected = 0, 0, False
+    if state_name == StateNames.VOTING:
+        spies_in_mission, leader, rejected = key[3:]
+    elif state_name == StateNames.SABOTAGE:
+        spies_in_mission, leader = key[3:]
+    state = ResistanceState(num_players, spies_in_mission, leader, None, state_name, rnd, 0, spies_in_mission, 5 if rejected else 0)
+    return tuple(state.generate_moves())
+
+
+# Builds the team selection tables of every game size
+def build_selection_tables():
+    for num_players in Agent.mission_sizes:
+        for rnd in range(5):
+            action_table((num_players, rnd, StateNames.SELECTION))
+
+
+build_selection_tables()
+
+
+
 # CLASSES TO DEFINE NODES IN THE MONTE CARLO TREE ------------------------------------------------------
 
 
@@ -502,6 +795,21 @@ class Node:
     def unexplored_actions(self, possible_actions):
         return [a for a in possible_actions if a not in self.children.keys()]
 
+
+    # Returns a node for the edge from parent through action into the same state as this node.
+    # The new node has statistics of its own, but shares this node's children (and DUCT statistics
+    # of a simultaneous move), so both paths search and update the same subtree.
+    def transpose(self, parent, action):
+        node = copy.copy(self)
+        node.parent = parent
+        node.action = action
+        node.reward = 0
+        node.visits = 0
+        node.avails = 0
+        node.determination_visits = {}
+        parent.children[action] = node
+        return node
+
     
     def __repr__(self):
         return "Node - Player %i [%s  W/V/A: %i/%i/%i]" % (
@@ -537,6 +845,107 @@ class Node:
         return s
 
 
+'''
+Gives ISMCTS the same interface to a tree of Node objects as ArrayTree gives to a tree stored in arrays.
+Nodes are passed around as the Node objects themselves.
+'''
+class NodeTree:
+    def __init__(self, root, table=None):
+        self.root = root
+        self.table = table                  # TranspositionTable of the states in the tree, None to not share states
+
+
+    def action(self, node):
+        return node.action
+
+
+    def player(self, node):
+        return node.player
+
+
+    def unexplored_actions(self, node, possible_actions):
+        return node.unexplored_actions(possible_actions)
+
+
+    # Chooses the child of node to descend to, makes its action on state and returns it.
+    # The child of a joint action is made the first time DUCT chooses it, through append_child so its state can be shared
+    def ucb_selection(self, node, possible_actions, exploration, state):
+        if type(node.player) == tuple:
+            joint_action = node.duct_selection(possible_actions, exploration)
+            state.make_move(joint_action)
+            child = node.children.get(joint_action)
+            return child if child is not None else self.append_child(node, state.player, joint_action, state)
+        child = node.ucb_selection(possible_actions, exploration)
+        state.make_move(child.action)
+        return child
+
+
+    def append_child(self, node, next_player, action, state=None):
+        if self.table is None or state is None:
+            return node.append_child(next_player, action)
+        key = state.key()
+        transposition = self.table.get(key)
+        if transposition is not None:
+            return transposition.transpose(node, action)
+        child = node.append_child(next_player, action)
+        self.table.put(key, child)
+        return child
+
+
+    def backpropagate(self, path, terminal_state):
+        child = None
+        for node in reversed(path):
+            child = node.backpropagate(terminal_state, child)
+
+
+    def best_action(self):
+        return max(self.root.children.values(), key=lambda c: c.visits).action
+
+
+    def root_summary(self):
+        return {(a.value, a.player): (c.visits, c.reward) for a, c in self.root.children.items()}
+
+
+    def descend(self, matches):
+        children = [c for a, c in self.root.children.items() if matches(a)]
+        if len(children) != 1:
+            return False
+        self.root = children[0]
+        self.root.parent = None
+        return True
+
+
+'''
+Maps the keys of states (see ResistanceState.key) to the first node made for that state in a NodeTree,
+so nodes made later for the same state share its subtree (see Node.transpose).
+It keeps at most capacity states, forgetting the least recently used one when it is full.
+Capacity only limits how many states can be shared, not memory: a forgotten node stays in the tree,
+and its state just gets a new node of its own if it is reached again.
+'''
+class TranspositionTable:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.nodes = OrderedDict()          # {state key: node, ...}, least recently used first
+
+
+    def get(self, key):
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+        return node
+
+
+    def put(self, key, node):
+        self.nodes[key] = node
+        self.nodes.move_to_end(key)
+        if len(self.nodes) > self.capacity:
+            self.nodes.popitem(last=False)
+
+
+    def __len__(self):
+        return len(self.nodes)
+
+
 '''
 A class used to define nodes in the Monte Carlo tree, where the game state contains simultaneous actions
 - i.e., when players are unable to observe the actions of other actors until all actions have been performed.
@@ -564,24 +973,28 @@ class SimultaneousMoveNode(Node):
             self.player_actions[p].append(ActionNode(p, self, True))
             self.player_actions[p].append(ActionNode(p, self, False))
 
-    
-    def ucb_selection(self, possible_actions, exploration):
-        legal_children = [c for a, c in self.children.items() if a in possible_actions]
-        for child in legal_children:
-            child.avails += 1
-
-        joint_action = []    
-        for p, actions in self.player_actions.items():
-            ucb_eq = lambda a: 0 if a.visits == 0 else \
-                a.reward / a.visits + exploration * sqrt(log(self.visits) / a.visits)
 
-            selected_action = max(actions, key=ucb_eq)
-            joint_action.append((p, selected_action.value))
+    # Every joint action can be chosen, so a simultaneous move is never left for expansion:
+    # DUCT chooses the joint action from the first visit, and its child is made when it is first chosen (see NodeTree.ucb_selection)
+    def unexplored_actions(self, possible_actions):
+        return []
 
-        joint_action, = [a for a in possible_actions if set(a.value) == set(joint_action)]
-        
-        node = self.children[joint_action]
-        return node
+    
+    # Chooses each player's action by UCB over that player's ActionNodes, an action that was never tried first,
+    # and returns the joint action, which is possible_actions[joint index] (see generate_moves).
+    # The children's avails are not counted, since DUCT does not use them.
+    def duct_selection(self, possible_actions, exploration):
+        joint_index = 0
+        for j, p in enumerate(self.player):
+            actions = self.player_actions[p]
+            total_visits = actions[0].visits + actions[1].visits
+            ucb_eq = lambda a: float('inf') if a.visits == 0 else \
+                a.reward / a.visits + exploration * sqrt(log(total_visits) / a.visits)
+
+            if max(actions, key=ucb_eq).value:
+                joint_index |= 1 << j
+
+        return possible_actions[joint_index]
 
     
     def append_child(self, next_player, joint_action):
@@ -597,8 +1010,9 @@ class SimultaneousMoveNode(Node):
     def backpropagate(self, terminal_state, child_node=None):
         if child_node:
             joint_action = child_node.action
-            for p, action in joint_action.value:
-                backpropagated_action, = [node for node in self.player_actions[p] if node.value == action]
+            for p in self.player:
+                # player_actions[p] is [True action, False action]
+                backpropagated_action = self.player_actions[p][0 if joint_action.value >> p & 1 else 1]
                 backpropagated_action.reward += terminal_state.game_result(p)
                 backpropagated_action.visits += 1
 
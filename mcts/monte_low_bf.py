@@ -1,21 +1,75 @@
 import random
 import time
+from bisect import bisect_right
+from itertools import accumulate
 from agent import Agent
+from mcts.rewards import MarginReward
 from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 
 MAX_TIME = 0.35
 
+'''
+Limits an ISMCTS search to a number of seconds, a number of iterations, or whichever comes first
+when both are given. A limit of None means no limit of that kind.
+'''
+class SearchBudget():
+    def __init__(self, max_time=MAX_TIME, max_iterations=None):
+        if max_time is None and max_iterations is None:
+            raise ValueError('A search budget needs a time or iteration limit')
+        self.max_time = max_time
+        self.max_iterations = max_iterations
+
+
+    def exhausted(self, elapsed, iterations):
+        return (self.max_time is not None and elapsed >= self.max_time) or \
+               (self.max_iterations is not None and iterations >= self.max_iterations)
+
+
+    # Fraction of the budget used so far, between 0 and 1
+    def progress(self, elapsed, iterations):
+        progress = 0
+        if self.max_time is not None:
+            progress = elapsed / self.max_time
+        if self.max_iterations is not None:
+            progress = max(progress, iterations / self.max_iterations)
+        return min(progress, 1)
+
+
 class Monte(Agent):
 
-    def __init__(self, name):
+    def __init__(self, name, budget=None, on_progress=None, progress_interval=100, reuse_tree=True, num_workers=1, belief_model=None,
+        reward_model=None):
         '''
         Initialises the agent, and gives it a name
         You can add configuration parameters etc here,
         but the default code will always assume a 1-parameter constructor, which is the agent's name.
         The agent will persist between games to allow for long-term learning etc.
+        budget is the SearchBudget of each decision, MAX_TIME seconds by default.
+        on_progress(iterations, best_action) is called every progress_interval iterations of a search
+        with the action of the most visited child of the root.
+        reuse_tree keeps the search tree between decisions, moving its root along the observed actions,
+        so a decision that follows the previous one starts from the statistics already gathered for it.
+        num_workers > 1 runs every search root parallel in that many worker processes (see search),
+        in which case trees are not reused and on_progress is not called.
+        belief_model is an optional mcts.belief.OpponentModel. With it, a resistance agent also weighs its
+        determinations by how likely the observed proposals, votes and sabotages are in each of them,
+        and samples them by weight rather than uniformly.
+        reward_model scores the end of each playout (see mcts/rewards.py), MarginReward by default.
         '''
         self.name = name
+        self.budget = budget if budget is not None else SearchBudget(MAX_TIME)
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.reuse_tree = reuse_tree
+        self.num_workers = num_workers
+        self.belief_model = belief_model
+        self.reward_model = reward_model if reward_model is not None else MarginReward()
+        self.executor = None                # Process pool of a root parallel search, started on its first search
+        self.root_node = None
+        self.iterations = 0                 # Number of ISMCTS iterations in the last search
 
     def __str__(self):
         '''
@@ -45,16 +99,19 @@ class Monte(Agent):
         self.player = player_number
         self.num_players = number_of_players
         if self.is_spy:
-            d = tuple([True if p in spies else False for p in range(number_of_players)])
-            self.determinations = [d]
-            self.probabilities = [1.0]
+            self.belief = BeliefState([to_mask(spies)])
         else:
-            self.determinations, self.probabilities = initialise_determinations(self.player, self.num_players)
+            self.belief = BeliefState(initialise_determinations(self.player, self.num_players))
+        self.updater = None                 # BayesianBelief of a resistance agent with a belief_model
+        if self.belief_model is not None and not self.is_spy:
+            from mcts.belief import BayesianBelief
+            self.updater = BayesianBelief(self.belief.worlds, self.num_players, self.player, self.belief_model)
 
         self.rnd = 0
         self.missions_succeeded = 0
         self.mission = []
         self.num_selection_fails = 0
+        self.root_node = None
 
 
     def propose_mission(self, team_size, fails_required = 1):
@@ -66,10 +123,9 @@ class Monte(Agent):
         self.leader = self.player
         self.state_name = StateNames.SELECTION
 
-        self.root_node = Node(self.player)
-
-        selected_node = self.ISMCTS(MAX_TIME, self.player)
-        mission = list(selected_node.action.value)
+        children, _ = self.search(self.player)
+        action_value = max(children, key=lambda key: children[key][0])[0]
+        mission = list(MASK_PLAYERS[action_value])
         return mission
 
 
@@ -84,11 +140,11 @@ class Monte(Agent):
         self.state_name = StateNames.VOTING
         self.mission = mission
 
-        self.root_node = SimultaneousMoveNode(range(self.num_players))
-
-        self.ISMCTS(MAX_TIME, range(self.num_players))
-        self_action = max(self.root_node.player_actions[self.player], 
-            key=lambda a: a.visits).value
+        if self.root_node is not None and self.root_node.player == proposer:
+            mission_mask = to_mask(mission)
+            self.follow(lambda a: a.src_type == StateNames.SELECTION and a.value == mission_mask)
+        _, choices = self.search(tuple(range(self.num_players)))
+        self_action = max(choices, key=choices.get)
         return self_action
 
 
@@ -100,11 +156,29 @@ class Monte(Agent):
         votes is a dictionary mapping player indexes to Booleans (True if they voted for the mission, False otherwise).
         No return value is required or expected.
         '''
-        num_votes_for = sum(votes)
-        if num_votes_for * 2 < self.num_players:
+        if self.updater is not None:
+            self.updater.observe_proposal(mission, proposer)
+            self.updater.observe_votes(mission, votes)
+            self.reweight()
+        num_votes_for = len(votes)
+        if num_votes_for * 2 <= self.num_players:
             self.num_selection_fails += 1
+            next_player = None
         else:
             self.num_selection_fails = 0
+            # the players of the sabotage that follows are only known if every world agrees on the spies in the mission
+            spies_in_mission = {d & to_mask(mission) for d in self.belief.worlds}
+            if len(spies_in_mission) > 1:
+                self.root_node = None
+                return
+            spies_in_mission = spies_in_mission.pop()
+            if spies_in_mission:
+                next_player = MASK_PLAYERS[spies_in_mission]
+            else:
+                next_player = (proposer + 1) % self.num_players if self.rnd < 4 else -1
+
+        self.follow(lambda a: a.src_type == StateNames.VOTING and a.value == num_votes_for and 
+            (next_player is None or a.player == next_player))
 
 
     def betray(self, mission, proposer):
@@ -118,13 +192,10 @@ class Monte(Agent):
         self.leader = proposer
         self.state_name = StateNames.SABOTAGE
         self.mission = mission
-        spies_in_mission = tuple([s for s in self.spies if s in self.mission])
+        spies_in_mission = MASK_PLAYERS[to_mask(self.spies) & to_mask(self.mission)]
 
-        self.root_node = SimultaneousMoveNode(spies_in_mission)
-
-        self.ISMCTS(MAX_TIME, spies_in_mission)
-        self_action = max(self.root_node.player_actions[self.player], 
-            key=lambda a: a.visits).value
+        _, choices = self.search(spies_in_mission)
+        self_action = max(choices, key=choices.get)
         return self_action
 
 
@@ -137,11 +208,16 @@ class Monte(Agent):
         and mission_success is True if there were not enough betrayals to cause the mission to fail, False otherwise.
         It iss not expected or required for this function to return anything.
         '''
+        if self.root_node is not None and type(self.root_node.player) == tuple:
+            self.follow(lambda a: a.src_type == StateNames.SABOTAGE and a.value == num_fails)
         if num_fails < Agent.fails_required[self.num_players][self.rnd]:
             self.missions_succeeded += 1 
         self.rnd += 1
         if not self.is_spy:
             self.remove_illegal_worlds(num_fails, mission)
+        if self.updater is not None:
+            self.updater.observe_sabotages(mission, num_fails)
+            self.reweight()
 
 
     def round_outcome(self, rounds_complete, missions_failed):
@@ -150,6 +226,8 @@ class Monte(Agent):
         rounds_complete, the number of rounds (0-5) that have been completed
         missions_failed, the numbe of missions (0-3) that have failed.
         '''
+        if self.num_selection_fails > 0:    # the round ended with five rejected teams, which the search tree does not model
+            self.root_node = None
         self.rnd = rounds_complete
         self.missions_succeeded = rounds_complete - missions_failed
         self.num_selection_fails = 0
@@ -161,40 +239,103 @@ class Monte(Agent):
         spies_win, True iff the spies caused 3+ missions to fail
         spies, a list of the player indexes for the spies.
         '''
-        pass
+        self.root_node = None
+
+
+    def search(self, root_player):
+        '''
+        runs ISMCTS for the decision of root_player and returns the root summary (see root_summary).
+        With num_workers > 1 the search is root parallel: each worker process searches its own tree
+        from the same state for the whole budget, and the summaries of all trees are added up.
+        '''
+        if self.num_workers > 1:
+            return self.parallel_search(root_player)
+        self.root_node = self.next_root(root_player)
+        self.ISMCTS(self.budget, root_player)
+        return root_summary(self.root_node, self.player)
+
+
+    def parallel_search(self, root_player):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        inputs = {name: getattr(self, name) for name in SEARCH_INPUTS}
+        futures = [self.executor.submit(root_search, inputs, root_player, self.budget, self.rng.getrandbits(64))
+            for _ in range(self.num_workers)]
+        results = [future.result() for future in futures]
 
+        self.iterations = sum(iterations for _, iterations in results)
+        return merge_summaries([summary for summary, _ in results])
+
+
+    def close(self):
+        '''
+        shuts down the worker processes of root parallel searches
+        '''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
 
-    def ISMCTS(self, max_time, current_player, use_simulated_annealing=False):
+
+    def next_root(self, player):
+        '''
+        returns the root node to search from for a decision of player,
+        which is the kept root if it is already that decision, or a new node otherwise
+        '''
+        if self.reuse_tree and self.root_node is not None and self.root_node.player == player:
+            return self.root_node
+        if type(player) == tuple:
+            return SimultaneousMoveNode(player)
+        return Node(player)
+
+
+    def follow(self, matches):
+        '''
+        moves the kept root to the child reached by the observed action,
+        the only child whose action satisfies matches, or drops the tree if there is no such child
+        '''
+        if self.root_node is None:
+            return
+        children = [c for a, c in self.root_node.children.items() if matches(a)]
+        if len(children) == 1:
+            self.root_node = children[0]
+            self.root_node.parent = None
+        else:
+            self.root_node = None
+
+
+    def ISMCTS(self, budget, current_player, use_simulated_annealing=False):
         start_time = time.time()
         time_diff = 0
         it = 0
-        while (time_diff < max_time):
+        mission = to_mask(self.mission)
+        while not budget.exhausted(time_diff, it):
             it += 1
             # determinize
-            determination = random.choices(self.determinations, self.probabilities)[0]
-            state = ResistanceState(determination, self.leader, current_player, self.state_name, self.rnd,
-                self.missions_succeeded, self.mission, self.num_selection_fails)
+            determination = self.belief.sample(self.rng)
+            state = ResistanceState(self.num_players, determination, self.leader, current_player, self.state_name, self.rnd,
+                self.missions_succeeded, mission, self.num_selection_fails)
 
-            temperature = min(0.8, (1 - time_diff / max_time))
+            temperature = min(0.8, (1 - budget.progress(time_diff, it - 1)))
             exploration = temperature if use_simulated_annealing else 0.7
 
             # selection
             node = self.root_node
             moves = state.get_moves()
-            while moves != [] and node.unexplored_actions(moves) == []: 
+            while moves and node.unexplored_actions(moves) == []: 
                 node = node.ucb_selection(moves, exploration)
                 state.make_move(node.action)
                 moves = state.get_moves()
 
             # expansion
-            if moves != []:    # if node is non-terminal
+            if moves:    # if node is non-terminal
                 unexplored_actions = node.unexplored_actions(moves)
-                action = random.choice(unexplored_actions)
+                action = self.rng.choice(unexplored_actions)
                 state.make_move(action)
                 node = node.append_child(state.player, action)
 
             # playout
-            terminal_state = playout(state)
+            terminal_state = playout(state, self.rng)
+            terminal_state.score(self.reward_model)
             
             # backpropagation
             child = node.backpropagate(terminal_state)
@@ -202,47 +343,130 @@ class Monte(Agent):
                 node = node.parent
                 child = node.backpropagate(terminal_state, child)
             time_diff = time.time() - start_time
+            if self.on_progress is not None and it % self.progress_interval == 0:
+                self.on_progress(it, max(self.root_node.children.values(), key=lambda c: c.visits).action)
 
+        self.iterations = it
         return max(self.root_node.children.values(), key=lambda c: c.visits) 
 
 
     def remove_illegal_worlds(self, num_sabotages, mission):
-        for i in range(len(self.determinations)):
-            d = self.determinations[i]
-            num_players = len(d)
-            spies = [p for p in range(num_players) if d[p]]
-            spies_in_mission = [s for s in spies if s in mission]
-            if num_sabotages > len(spies_in_mission):
-                self.probabilities[i] = 0
-            normalise_probabilities(self.probabilities)
+        mission = to_mask(mission)
+        self.belief.prune(lambda d: POPCOUNT[d & mission] >= num_sabotages)
+
+
+    # Replaces the belief with the live worlds of the belief updater, weighted by their likelihood
+    def reweight(self):
+        self.belief = BeliefState(*self.updater.live())
+
+
+def playout(state, rng=random):
+    return state.playout(rng)
+
 
+# Attributes of Monte that a root parallel worker needs to rebuild the state of a search
+SEARCH_INPUTS = ('num_players', 'player', 'belief', 'reward_model', 'leader', 'state_name', 'rnd', 
+    'missions_succeeded', 'mission', 'num_selection_fails')
 
-def playout(state):
-    moves = state.get_moves()
-    while moves != []:
-        state.make_move(random.choice(moves))
-        moves = state.get_moves()
-    return state       
+
+# Runs one tree of a root parallel search in a worker process.
+# Returns the root summary of the tree and the number of iterations.
+def root_search(inputs, root_player, budget, seed):
+    searcher = Monte('root search', budget, reuse_tree=False)
+    for name, value in inputs.items():
+        setattr(searcher, name, value)
+    searcher.set_rng(random.Random(seed))
+    searcher.root_node = searcher.next_root(root_player)
+    searcher.ISMCTS(budget, root_player)
+    return root_summary(searcher.root_node, searcher.player), searcher.iterations
+
+
+# Returns the visits and rewards of the children of root, keyed by (action value, next player) rather than
+# by Action, whose hash differs between processes, and the visits of each choice of player at a simultaneous move.
+def root_summary(root, player):
+    children = {(a.value, a.player): (c.visits, c.reward) for a, c in root.children.items()}
+    choices = {a.value: a.visits for a in root.player_actions.get(player, [])} if type(root.player) == tuple else {}
+    return children, choices
+
+
+# Adds up the root summaries of several trees
+def merge_summaries(summaries):
+    children = {}
+    choices = {}
+    for summary_children, summary_choices in summaries:
+        for key, (visits, reward) in summary_children.items():
+            total_visits, total_reward = children.get(key, (0, 0))
+            children[key] = (total_visits + visits, total_reward + reward)
+        for value, visits in summary_choices.items():
+            choices[value] = choices.get(value, 0) + visits
+    return children, choices
 
 
 def initialise_determinations(player, num_players):
     num_spies = Agent.spy_count[num_players]
     possible_spies = filter(lambda p: p != player, range(num_players))
-    spy_configurations = list(combinations(possible_spies, num_spies))
-    determinations = []
-    probabilities = []
-    for spies in spy_configurations:
-        d = tuple([True if p in spies else False for p in range(num_players)])
-        p = 1 / len(spy_configurations)          # Equal probability to choose a determination
-        determinations.append(d)
-        probabilities.append(p)
-    return determinations, probabilities
-        
+    return [to_mask(spies) for spies in combinations(possible_spies, num_spies)]
+
+
+# The worlds (determinations) a player still believes possible, with the weight of each.
+# Only live worlds are kept, so removing worlds is one pass over them, and sampling is a binary search
+# of the cumulative weights, which are rebuilt on the first sample after the worlds or weights change.
+class BeliefState():
+    def __init__(self, worlds, weights=None):
+        self.worlds = list(worlds)
+        self.weights = list(weights) if weights is not None else [1.0] * len(self.worlds)
+        self.cumulative = None      # Running totals of weights, None until the next sample
+
+
+    def __len__(self):
+        return len(self.worlds)
+
+
+    # Returns a world drawn with probability proportional to its weight
+    def sample(self, rng=random):
+        if self.cumulative is None:
+            self.cumulative = list(accumulate(self.weights))
+        i = bisect_right(self.cumulative, rng.random() * self.cumulative[-1])
+        return self.worlds[min(i, len(self.worlds) - 1)]
+
+
+    # Keeps only the worlds for which legal(world) is True.
+    # If no world is legal, which only happens if the observations contradict the belief, the belief is left as is.
+    def prune(self, legal):
+        live = [(w, p) for w, p in zip(self.worlds, self.weights) if legal(w) and p > 0]
+        if live:
+            self.worlds = [w for w, _ in live]
+            self.weights = [p for _, p in live]
+            self.cumulative = None
+
+
+    # Returns the probability of each world, in the order of self.worlds
+    def probabilities(self):
+        total = sum(self.weights)
+        return [p / total for p in self.weights]
+
+
+# Returns the bitmask with bit p set for each player p in players
+def to_mask(players):
+    mask = 0
+    for p in players:
+        mask |= 1 << p
+    return mask
+
+
+# Returns the bitmasks of every team of mission_size players, built once for each game size and team size
+def team_masks(num_players, mission_size):
+    key = (num_players, mission_size)
+    if key not in TEAM_MASKS:
+        TEAM_MASKS[key] = tuple(to_mask(team) for team in combinations(range(num_players), mission_size))
+    return TEAM_MASKS[key]
+
 
-def normalise_probabilities(probabilities):
-    n_legal_determinations = [p for p in probabilities if p != 0]
-    for i in range(len(probabilities)):
-        if probabilities[i] != 0: probabilities[i] = 1 / len(n_legal_determinations)
+TEAM_MASKS = {}
+# Determinations and teams are bitmasks over at most 10 players, where bit p is player p.
+# POPCOUNT[mask] is the number of players in mask and MASK_PLAYERS[mask] the tuple of players in mask.
+POPCOUNT = tuple(bin(mask).count('1') for mask in range(1 << 10))
+MASK_PLAYERS = tuple(tuple(p for p in range(10) if mask >> p & 1) for mask in range(1 << 10))
 
 
 
@@ -255,6 +479,19 @@ class Roles():
     NON_SPY = 'RESISTANCE'
 
 
+'''
+Tables of possible actions are shared by every state with the same key (see ResistanceState.get_moves and action_table).
+Besides the state name and round, the actions depend on which spies are in the mission (the next players
+of a sabotage) and on the leader and number of rejected teams (the next player, or the end of the round).
+The tables of team selections are built when the module is imported, for every game size.
+There are too many voting and sabotage keys to build them all, so those tables are built the first time
+their key is seen and kept in a least recently used cache of ACTION_TABLE_SIZE tables. A voting table of 10 players
+has 1024 actions (about 150 KB), so the cache takes at most about 150 MB, and much less in practice.
+Each process has its own cache; the workers of a root parallel search live as long as the agent, so they keep theirs.
+'''
+ACTION_TABLE_SIZE = 1024
+
+
 class StateNames():
     SELECTION = 'MISSION SELECTION'
     VOTING = 'VOTING'
@@ -266,6 +503,8 @@ class StateNames():
 A class to encapsulate information relevant to an action
 '''
 class Action():
+    __slots__ = ('src_type', 'dst_type', 'player', 'value', 'is_simultaneous', 'hash')
+
     def __init__(self, src_type, dst_type, player, value):
         self.src_type = src_type
         self.dst_type = dst_type
@@ -274,10 +513,11 @@ class Action():
         self.is_simultaneous = False
         if src_type == StateNames.SABOTAGE or src_type == StateNames.VOTING:
             self.is_simultaneous = True
+        self.hash = hash((self.src_type, self.dst_type, self.player, self.value))   # Actions are shared and never change, so hash once
 
 
     def __hash__(self):
-        return hash((self.src_type, self.dst_type, self.player, self.value))
+        return self.hash
 
 
     def __eq__(self, other):
@@ -294,27 +534,45 @@ A class used to define a perfect information representation of a game state in
 Avalon Resistance, including methods to get all moves and apply moves.
 '''
 class ResistanceState():
-    def __init__(self, determination, leader, player, state_name, rnd, 
-        missions_succeeded, mission=[], num_selection_fails=0):
+    def __init__(self, num_players, determination, leader, player, state_name, rnd, 
+        missions_succeeded, mission=0, num_selection_fails=0):
+        self.num_players = num_players
         self.leader = leader                                    # Stores the player_id of the last leader (current leader if in SELECTION state)
         self.player = player                                    # Current player/players in the state. -1 for a terminal state.  
-        self.determination = determination                      # Array of booleans such that player 'p_id' is a spy if determination[p_id] = True
+        self.determination = determination                      # Bitmask such that player 'p_id' is a spy if bit p_id is set
         self.state_name = state_name                            # Defines the current game state (SELECTION, VOTING, SABOTAGE or TERMINAL)
         self.rnd = rnd       
         self.missions_succeeded = missions_succeeded 
-        self.mission = mission                                
+        self.mission = mission                                  # Bitmask of the players in the mission
         self.num_selection_fails = num_selection_fails          # Number of times a team has been rejected in the same round (max 5)  
+        self.num_moves = 0                                      # Number of moves made from the initial state
+        self.rewards = None                                     # (resistance reward, spy reward) of a scored terminal state
 
 
-    # Returns all possible actions from this state => A(state)
+    # Returns all possible actions from this state => A(state), as a tuple shared by every state with the same key
     def get_moves(self):
+        num_players = self.num_players
+        if self.state_name == StateNames.SELECTION:
+            key = (num_players, self.rnd, self.state_name)
+        elif self.state_name == StateNames.VOTING:
+            key = (num_players, self.rnd, self.state_name, self.determination & self.mission, self.leader, self.num_selection_fails >= 5)
+        elif self.state_name == StateNames.SABOTAGE:
+            key = (num_players, self.rnd, self.state_name, self.determination & self.mission, self.leader)
+        else:
+            return ()
+
+        return action_table(key)
+
+
+    # Builds the list of possible actions from this state
+    def generate_moves(self):
         actions = []
-        num_players = len(self.determination)
+        num_players = self.num_players
 
         if self.state_name == StateNames.SELECTION:
             mission_size = Agent.mission_sizes[num_players][self.rnd]
             possible_missions = combinations(range(num_players), mission_size) 
-            action_vals = [tuple(mission) for mission in possible_missions]
+            action_vals = [to_mask(mission) for mission in possible_missions]
             actions = [self.generate_action(StateNames.SELECTION, val) for val in action_vals]
         
         elif self.state_name == StateNames.VOTING:
@@ -322,10 +580,8 @@ class ResistanceState():
             actions = [self.generate_action(StateNames.VOTING, val) for val in action_vals]
 
         elif self.state_name == StateNames.SABOTAGE:
-            spies = [p for p in range(num_players) if self.determination[p]]
-            spies_in_mission = [p for p in self.mission if p in spies]
-
-            action_vals = range(len(spies_in_mission) + 1)
+            spies_in_mission = self.determination & self.mission
+            action_vals = range(POPCOUNT[spies_in_mission] + 1)
             actions = [self.generate_action(StateNames.SABOTAGE, val) for val in action_vals]
         return actions
 
@@ -334,35 +590,34 @@ class ResistanceState():
         rnd = self.rnd
         dst_state = None
         player = None
-        num_players = len(self.determination)
-        spies = [p for p in range(num_players) if self.determination[p]]
+        num_players = self.num_players
 
         if src_state == StateNames.SELECTION:
             dst_state = StateNames.VOTING  
             player = tuple(range(num_players))                
 
         elif src_state == StateNames.VOTING:
-            spies_in_mission = tuple([p for p in self.mission if p in spies])                     
+            spies_in_mission = self.determination & self.mission
             num_votes_for = action_val  
 
             if num_votes_for * 2 > num_players:
                 if spies_in_mission:
                     dst_state = StateNames.SABOTAGE
-                    player = spies_in_mission
+                    player = MASK_PLAYERS[spies_in_mission]
                 else:
                     dst_state = StateNames.SELECTION
-                    player = (self.leader + 1) % len(self.determination) 
+                    player = (self.leader + 1) % num_players 
                     rnd += 1
 
             else:
                 dst_state = StateNames.SELECTION
-                player = (self.leader + 1) % len(self.determination) 
+                player = (self.leader + 1) % num_players 
                 if self.num_selection_fails >= 5:
                     rnd += 1
 
         elif src_state == StateNames.SABOTAGE:
             dst_state = StateNames.SELECTION
-            player = (self.leader + 1) % len(self.determination) 
+            player = (self.leader + 1) % num_players 
             rnd += 1
         
         if rnd > 4:
@@ -374,67 +629,93 @@ class ResistanceState():
 
     # Changes the game state object into a new state s' where s' = s(move)
     def make_move(self, action):
-        num_players = len(self.determination)
-        spies = [p for p in range(num_players) if self.determination[p]]
-
         if action.src_type == StateNames.SELECTION:
-            self.state_name = StateNames.VOTING
-            self.player = tuple(range(num_players))
-            self.mission = action.value                         # Action is a list of player ids in the mission
-
+            self.select_mission(action.value)                   # Action is a bitmask of the players in the mission
         elif action.src_type == StateNames.VOTING:
-            spies_in_mission = tuple([p for p in self.mission if p in spies])                      # Action has format ((p1, action1), (p2, action2), (p3, action3), ...)
-            num_votes_for = action.value   
+            self.apply_votes(action.value)    # Action is the number of players voting for the mission
+        elif action.src_type == StateNames.SABOTAGE:
+            self.apply_sabotages(action.value)    # Action is the number of spies sabotaging the mission
+
+
+    # Plays uniformly random moves until the game ends and returns the terminal state.
+    # Moves are sampled directly as team bitmasks and vote/sabotage counts, without building any actions.
+    def playout(self, rng=random):
+        num_players = self.num_players
+        while self.state_name != StateNames.TERMINAL:
+            if self.state_name == StateNames.SELECTION:
+                self.select_mission(rng.choice(team_masks(num_players, Agent.mission_sizes[num_players][self.rnd])))
+            elif self.state_name == StateNames.VOTING:
+                self.apply_votes(rng.randrange(num_players + 1))
+            else:
+                self.apply_sabotages(rng.randrange(len(self.player) + 1))
+        return self
 
-            if num_votes_for * 2 > num_players:
-                if spies_in_mission:
-                    self.state_name = StateNames.SABOTAGE
-                    self.player = spies_in_mission
-                else:
-                    self.state_name = StateNames.SELECTION
-                    self.leader = (self.leader + 1) % len(self.determination) 
-                    self.player = self.leader
-                    self.rnd += 1
-                    self.missions_succeeded += 1
-                self.num_selection_fails = 0
-
-            elif self.num_selection_fails < 5:
-                self.state_name = StateNames.SELECTION
-                self.leader = (self.leader + 1) % len(self.determination) 
-                self.player = self.leader
-                self.num_selection_fails += 1
 
+    def select_mission(self, mission):
+        self.num_moves += 1
+        self.state_name = StateNames.VOTING
+        self.player = tuple(range(self.num_players))
+        self.mission = mission
+
+
+    def apply_votes(self, num_votes_for):
+        self.num_moves += 1
+        num_players = self.num_players
+        spies_in_mission = self.determination & self.mission
+
+        if num_votes_for * 2 > num_players:
+            if spies_in_mission:
+                self.state_name = StateNames.SABOTAGE
+                self.player = MASK_PLAYERS[spies_in_mission]
             else:
                 self.state_name = StateNames.SELECTION
-                self.leader = (self.leader + 1) % len(self.determination) 
+                self.leader = (self.leader + 1) % num_players 
                 self.player = self.leader
-                self.num_selection_fails = 0
                 self.rnd += 1
-
-        elif action.src_type == StateNames.SABOTAGE:
-            num_fails_required = Agent.fails_required[num_players][self.rnd]
-            self.rnd += 1
-            num_sabotages = action.value
-
-            if num_sabotages < num_fails_required:
                 self.missions_succeeded += 1
+            self.num_selection_fails = 0
+
+        elif self.num_selection_fails < 5:
+            self.state_name = StateNames.SELECTION
+            self.leader = (self.leader + 1) % num_players 
+            self.player = self.leader
+            self.num_selection_fails += 1
 
+        else:
             self.state_name = StateNames.SELECTION
-            self.leader = (self.leader + 1) % len(self.determination) 
+            self.leader = (self.leader + 1) % num_players 
             self.player = self.leader
+            self.num_selection_fails = 0
+            self.rnd += 1
+
+        if self.rnd > 4:
+            self.state_name = StateNames.TERMINAL
+
+
+    def apply_sabotages(self, num_sabotages):
+        self.num_moves += 1
+        num_fails_required = Agent.fails_required[self.num_players][self.rnd]
+        self.rnd += 1
+
+        if num_sabotages < num_fails_required:
+            self.missions_succeeded += 1
+
+        self.state_name = StateNames.SELECTION
+        self.leader = (self.leader + 1) % self.num_players 
+        self.player = self.leader
         
         if self.rnd > 4:
             self.state_name = StateNames.TERMINAL
 
 
-     # Returns the reward for a player based on the current determination stored in the state
+    # Computes the reward of each role at a terminal state with reward_model, once for the whole backpropagation
+    def score(self, reward_model):
+        self.rewards = reward_model(self)
+
+
+    # Returns the reward for a player based on the current determination stored in the state, once it is scored
     def game_result(self, player):
-        num_fails = self.rnd - self.missions_succeeded
-        if self.determination[player]:  # player is a spy
-            score = num_fails - self.missions_succeeded
-        else:
-            score = self.missions_succeeded - num_fails
-        return score         
+        return self.rewards[self.determination >> player & 1]         
 
     
     def __repr__(self):
@@ -445,6 +726,31 @@ class ResistanceState():
 
 
 
+# Builds the actions of every state with the key (see ResistanceState.get_moves) from a stand-in state,
+# whose only spies are the spies in the mission
+@lru_cache(maxsize=ACTION_TABLE_SIZE)
+def action_table(key):
+    num_players, rnd, state_name = key[:3]
+    spies_in_mission, leader, rejected = 0, 0, False
+    if state_name == StateNames.VOTING:
+        spies_in_mission, leader, rejected = key[3:]
+    elif state_name == StateNames.SABOTAGE:
+        spies_in_mission, leader = key[3:]
+    state = ResistanceState(num_players, spies_in_mission, leader, None, state_name, rnd, 0, spies_in_mission, 5 if rejected else 0)
+    return tuple(state.generate_moves())
+
+
+# Builds the team selection tables of every game size
+def build_selection_tables():
+    for num_players in Agent.mission_sizes:
+        for rnd in range(5):
+            action_table((num_players, rnd, StateNames.SELECTION))
+
+
+build_selection_tables()
+
+
+
 # CLASSES TO DEFINE MONTE CARLO TREE NODES -------------------------------------------------------------
 
 
@@ -0,0 +1,33 @@
+'''
+Reward models of the ISMCTS agents. A reward model is called once on the terminal state of each playout
+and returns the reward of each role as (resistance reward, spy reward), which the state keeps
+(see ResistanceState.score) so backpropagation only looks the reward of each player up.
+Any picklable callable with that signature can be given to Monte as its reward_model.
+'''
+
+
+# Missions succeeded minus missions failed for the resistance, the opposite for the spies
+class MarginReward:
+    def __call__(self, state):
+        margin = 2 * state.missions_succeeded - state.rnd
+        return margin, -margin
+
+
+# 1 for the winning side and -1 for the losing side
+class WinLossReward:
+    def __call__(self, state):
+        return (1, -1) if state.missions_succeeded >= 3 else (-1, 1)
+
+
+# The rewards of another model, scaled by gamma for every move of the playout after the searched state,
+# so an outcome reached in fewer moves counts for more
+class DiscountedReward:
+    def __init__(self, model=None, gamma=0.97):
+        self.model = model if model is not None else MarginReward()
+        self.gamma = gamma
+
+
+    def __call__(self, state):
+        discount = self.gamma ** state.num_moves
+        resistance_reward, spy_reward = self.model(state)
+        return resistance_reward * discount, spy_reward * discount
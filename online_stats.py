@@ -0,0 +1,108 @@
+'''
+Win rates of a tournament that are updated one game at a time, with Wilson score intervals,
+so a tournament can stop as soon as the win rates are known well enough rather than after a
+fixed number of games.
+'''
+
+from math import sqrt
+
+
+def new_stats(num_agents):
+    '''
+    returns an empty tournament_stats list with one dictionary per agent in the roster
+    '''
+    return [{'spy_wins':0, 'spy_games':0, 'resistance_wins':0, 'resistance_games':0} for _ in range(num_agents)]
+
+
+def merge_stats(stats, other):
+    '''
+    adds the counts in other into stats, where both are tournament_stats lists for the same roster
+    '''
+    for a in range(len(stats)):
+        for key in stats[a]:
+            stats[a][key] += other[a][key]
+    return stats
+
+
+def wilson_interval(wins, games, z=1.96):
+    '''
+    returns the (low, high) Wilson score interval of a win rate of wins out of games,
+    at the confidence level of z (1.96 for 95%). (0, 1) if there are no games.
+    '''
+    if games == 0:
+        return 0.0, 1.0
+    p = wins / games
+    denominator = 1 + z * z / games
+    centre = (p + z * z / (2 * games)) / denominator
+    half_width = z * sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+class OnlineStats:
+    '''
+    Spy, resistance and overall win counts of each agent of a roster, in the tournament_stats format
+    ({'spy_wins', 'spy_games', 'resistance_wins', 'resistance_games'} per agent).
+    A tournament is done (see done) when every win rate's interval is narrower than target_width,
+    or when the overall win rate intervals of all agents no longer overlap, so their ranking is settled.
+    Intervals are checked every time done is called, so checking after every game rather than every
+    hundred games makes a stop on a chance fluctuation a little more likely.
+    '''
+
+    def __init__(self, num_agents, target_width=0.05, min_games=100, z=1.96):
+        self.stats = new_stats(num_agents)
+        self.target_width = target_width
+        self.min_games = min_games
+        self.z = z
+
+    @property
+    def games(self):
+        '''
+        the number of games recorded, counted by the games of the first agent, who plays every game
+        '''
+        return self.stats[0]['spy_games'] + self.stats[0]['resistance_games']
+
+    def record(self, agent, is_spy, won):
+        '''
+        records one game of the agent with index agent in the roster
+        '''
+        role = 'spy' if is_spy else 'resistance'
+        self.stats[agent][role + '_games'] += 1
+        if won:
+            self.stats[agent][role + '_wins'] += 1
+
+    def merge(self, stats):
+        '''
+        adds the counts of a tournament_stats list for the same roster
+        '''
+        merge_stats(self.stats, stats)
+
+    def interval(self, agent, role='overall'):
+        '''
+        returns the Wilson interval of the win rate of agent as a 'spy', in the 'resistance', or 'overall'
+        '''
+        s = self.stats[agent]
+        if role == 'overall':
+            return wilson_interval(s['spy_wins'] + s['resistance_wins'], s['spy_games'] + s['resistance_games'], self.z)
+        return wilson_interval(s[role + '_wins'], s[role + '_games'], self.z)
+
+    def max_width(self):
+        '''
+        returns the width of the widest interval of any agent's spy, resistance or overall win rate
+        '''
+        widths = [high - low for a in range(len(self.stats))
+                  for low, high in (self.interval(a, role) for role in ('spy', 'resistance', 'overall'))]
+        return max(widths)
+
+    def separated(self):
+        '''
+        returns True if no two agents' overall win rate intervals overlap
+        '''
+        intervals = sorted(self.interval(a) for a in range(len(self.stats)))
+        return len(intervals) > 1 and all(intervals[i][1] < intervals[i + 1][0] for i in range(len(intervals) - 1))
+
+    def done(self):
+        '''
+        returns True once at least min_games games are recorded, and the win rates are narrow enough
+        or the agents are separated
+        '''
+        return self.games >= self.min_games and (self.max_width() <= self.target_width or self.separated())
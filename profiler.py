@@ -0,0 +1,191 @@
+'''
+Measures how long agents take in each of their callbacks (propose_mission, vote, betray, new_game and the *_outcome methods).
+A Profiler given to a Game (see Game) wraps every agent of the game in an InstrumentedAgent,
+which times each callback and adds it to a latency histogram of that agent and callback.
+Histograms have logarithmic buckets, so they are small and of fixed size however many calls they count,
+and profiles of different processes are merged by adding their buckets (see tournament.play_tournament).
+'''
+
+from time import perf_counter_ns
+import json
+import math
+
+
+CALLBACKS = ['new_game', 'propose_mission', 'vote', 'vote_outcome', 'betray', 'mission_outcome', 'round_outcome', 'game_outcome']
+
+
+class LatencyHistogram:
+    '''
+    Counts latencies in buckets of BUCKETS_PER_OCTAVE buckets per doubling of nanoseconds,
+    so a percentile is known to within a factor of 2**(1/BUCKETS_PER_OCTAVE) (about 19%).
+    '''
+
+    BUCKETS_PER_OCTAVE = 4
+    #2**40 ns is about 18 minutes, longer calls are counted in the last bucket
+    NUM_BUCKETS = 40 * BUCKETS_PER_OCTAVE
+
+    def __init__(self):
+        self.buckets = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+
+    def add(self, ns):
+        bucket = int(math.log2(ns) * self.BUCKETS_PER_OCTAVE) if ns > 1 else 0
+        self.buckets[min(bucket, self.NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += ns
+
+    def merge(self, other):
+        for i in range(self.NUM_BUCKETS):
+            self.buckets[i] += other.buckets[i]
+        self.count += other.count
+        self.total_ns += other.total_ns
+
+    def percentile(self, q):
+        '''
+        returns the latency in seconds below which a fraction q of calls fall,
+        taken as the geometric middle of the bucket it falls in
+        '''
+        if self.count == 0:
+            return float('nan')
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n > 0:
+                return 2 ** ((i + 0.5) / self.BUCKETS_PER_OCTAVE) * 1e-9
+        return 2 ** (self.NUM_BUCKETS / self.BUCKETS_PER_OCTAVE) * 1e-9
+
+    def summary(self):
+        return {
+            'calls': self.count,
+            'total_s': self.total_ns * 1e-9,
+            'mean_s': self.total_ns * 1e-9 / self.count if self.count else float('nan'),
+            'p50_s': self.percentile(0.5),
+            'p95_s': self.percentile(0.95),
+            'p99_s': self.percentile(0.99),
+        }
+
+
+class InstrumentedAgent:
+    '''
+    Stands in for an agent in a game, passing every callback on to the agent
+    and adding the time it took to the profiler.
+    '''
+
+    def __init__(self, agent, profiler):
+        self.agent = agent
+        self.histograms = profiler.agent_histograms(agent)
+
+    def __str__(self):
+        return str(self.agent)
+
+    def __repr__(self):
+        return repr(self.agent)
+
+    def __getattr__(self, name):
+        #anything that is not a callback, such as set_rng, goes straight to the agent
+        return getattr(self.agent, name)
+
+    def _timed(self, callback, *args):
+        start = perf_counter_ns()
+        result = getattr(self.agent, callback)(*args)
+        self.histograms[callback].add(perf_counter_ns() - start)
+        return result
+
+    def new_game(self, *args):
+        return self._timed('new_game', *args)
+
+    def propose_mission(self, *args):
+        return self._timed('propose_mission', *args)
+
+    def vote(self, *args):
+        return self._timed('vote', *args)
+
+    def vote_outcome(self, *args):
+        return self._timed('vote_outcome', *args)
+
+    def betray(self, *args):
+        return self._timed('betray', *args)
+
+    def mission_outcome(self, *args):
+        return self._timed('mission_outcome', *args)
+
+    def round_outcome(self, *args):
+        return self._timed('round_outcome', *args)
+
+    def game_outcome(self, *args):
+        return self._timed('game_outcome', *args)
+
+
+class Profiler:
+    '''
+    Latency histograms of every callback of every agent it has wrapped, keyed by the agent's name,
+    so the same agent in different processes (or games) is counted together.
+    '''
+
+    def __init__(self):
+        #{agent name: {callback: LatencyHistogram}}
+        self.histograms = {}
+        #{agent name: class name of the agent}
+        self.agent_types = {}
+
+    def agent_histograms(self, agent):
+        name = str(agent)
+        if name not in self.histograms:
+            self.histograms[name] = {callback: LatencyHistogram() for callback in CALLBACKS}
+            self.agent_types[name] = type(agent).__name__
+        return self.histograms[name]
+
+    def wrap(self, agent):
+        '''
+        returns an InstrumentedAgent that times agent's callbacks
+        '''
+        return InstrumentedAgent(agent, self)
+
+    def merge(self, other):
+        '''
+        adds the histograms of another profiler into this one
+        '''
+        for name, callbacks in other.histograms.items():
+            self.agent_types.setdefault(name, other.agent_types[name])
+            histograms = self.histograms.setdefault(name, {callback: LatencyHistogram() for callback in CALLBACKS})
+            for callback, histogram in callbacks.items():
+                histograms[callback].merge(histogram)
+        return self
+
+    def report(self):
+        '''
+        returns {agent name: {'type': class name, 'total_s': seconds in all callbacks, 'callbacks': {callback: summary}}},
+        where a summary has the number of calls, total and mean time and the p50, p95 and p99 latencies.
+        Callbacks that were never called are left out.
+        '''
+        report = {}
+        for name, callbacks in self.histograms.items():
+            summaries = {callback: h.summary() for callback, h in callbacks.items() if h.count}
+            report[name] = {
+                'type': self.agent_types[name],
+                'total_s': sum(s['total_s'] for s in summaries.values()),
+                'callbacks': summaries,
+            }
+        return report
+
+    def export(self, path):
+        '''
+        writes the report as JSON to path
+        '''
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+    def print_report(self):
+        '''
+        prints the report, with the agents that took the most time first
+        '''
+        print('--------PROFILE----------')
+        report = self.report()
+        for name in sorted(report, key=lambda n: -report[n]['total_s']):
+            print(f'{name} ({report[name]["type"]}): {report[name]["total_s"]:.3f}s')
+            for callback, s in report[name]['callbacks'].items():
+                print(f'    {callback:<16} calls={s["calls"]:<9} total={s["total_s"]:.3f}s '
+                      f'p50={s["p50_s"]*1e6:.1f}us p95={s["p95_s"]*1e6:.1f}us p99={s["p99_s"]*1e6:.1f}us')
+        print('-' * 100)
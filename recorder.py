@@ -0,0 +1,146 @@
+'''
+Records games of The Resistance as fixed width binary records, so long tournaments can be kept
+and analysed later without replaying them or formatting strings while they are played.
+A recorder writes to its own directory:
+- games.bin, one GAME_DTYPE record per game
+- missions.bin, one MISSION_DTYPE record per proposed mission, in the order they were proposed
+- roster.json, the names of the roster and the layout of both record types
+Both .bin files are append-only arrays of records, so they can be read back with numpy.fromfile
+or numpy.memmap (see replay.py). Teams, votes and spies are bitmasks with bit p set for seat p.
+Both files are flushed together, so missions.bin only runs past games.bin if a run stops mid game.
+Those trailing missions have no game record: replay.analyse ignores them, and a recorder reopening
+the directory drops them.
+'''
+
+import json
+import os
+import numpy as np
+
+
+MAX_PLAYERS = 10
+
+GAME_DTYPE = np.dtype([
+    ('game', '<u8'),                        # Id of the game, counting from 0 in each directory
+    ('num_players', 'u1'),
+    ('spies', '<u2'),                       # Seats of the spies
+    ('missions_lost', 'u1'),
+    ('num_missions', 'u1'),                 # Number of missions proposed in the game
+    ('seating', 'i1', (MAX_PLAYERS,)),      # Index in the roster of the agent in each seat, -1 for empty seats
+])
+
+MISSION_DTYPE = np.dtype([
+    ('game', '<u8'),
+    ('round', 'u1'),
+    ('proposal', 'u1'),                     # Number of teams proposed earlier in the round
+    ('leader', 'u1'),
+    ('team', '<u2'),
+    ('votes_for', '<u2'),
+    ('fails', 'i1'),                        # Number of betrayals, -1 if the team was not approved
+    ('success', '?'),
+])
+
+
+def to_mask(seats):
+    mask = 0
+    for seat in seats:
+        mask |= 1 << seat
+    return mask
+
+
+class GameRecorder:
+    '''
+    Records every game it is given to (see Game and tournament.play_game) into a directory.
+    Records are buffered in chunks of chunk_size and appended to the files when either chunk is full,
+    and when flush or close is called. Recording into a directory that already has records
+    appends to them, with game ids continuing from the last recorded game.
+    '''
+
+    def __init__(self, directory, roster, chunk_size=65536):
+        '''
+        directory is created if it does not exist,
+        roster is the list of agents that will play the recorded games, whose names are saved with the records.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.games_path = os.path.join(directory, 'games.bin')
+        self.missions_path = os.path.join(directory, 'missions.bin')
+        with open(os.path.join(directory, 'roster.json'), 'w') as f:
+            json.dump({'roster': [str(agent) for agent in roster],
+                       'game_dtype': GAME_DTYPE.descr,
+                       'mission_dtype': MISSION_DTYPE.descr}, f)
+
+        self.games = np.zeros(chunk_size, dtype=GAME_DTYPE)
+        self.missions = np.zeros(chunk_size, dtype=MISSION_DTYPE)
+        self.num_games = 0                  # Records in the buffers not yet written
+        self.num_missions = 0
+        self.next_game = os.path.getsize(self.games_path) // GAME_DTYPE.itemsize if os.path.exists(self.games_path) else 0
+        if os.path.exists(self.missions_path) and os.path.getsize(self.missions_path) > 0:
+            #drops the missions of a game an earlier run stopped in, which would otherwise take the next game's id
+            game_ids = np.memmap(self.missions_path, dtype=MISSION_DTYPE, mode='r')['game']
+            num_missions = int(np.searchsorted(game_ids, self.next_game))
+            del game_ids
+            os.truncate(self.missions_path, num_missions * MISSION_DTYPE.itemsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start_game(self, game, seating):
+        '''
+        called before game is played, where seating is the index in the roster of the agent in each seat
+        '''
+        self.seating = [-1] * MAX_PLAYERS
+        self.seating[:len(seating)] = seating
+        self.round = 0
+        self.proposal = 0
+        self.game_missions = 0
+
+    def record_mission(self, mission):
+        '''
+        called by Mission.run once the votes, and any betrayals, are in
+        '''
+        if mission.rnd != self.round:
+            self.round = mission.rnd
+            self.proposal = 0
+        approved = mission.is_approved()
+        self.missions[self.num_missions] = (self.next_game, mission.rnd, self.proposal, mission.leader_id,
+            to_mask(mission.team), to_mask(mission.votes_for), len(mission.fails) if approved else -1,
+            approved and mission.is_successful())
+        self.proposal += 1
+        self.game_missions += 1
+        self.num_missions += 1
+        if self.num_missions == len(self.missions):
+            self.flush()
+
+    def end_game(self, game):
+        '''
+        called by Game.play after the last round
+        '''
+        self.games[self.num_games] = (self.next_game, game.num_players, to_mask(game.spies), game.missions_lost,
+            self.game_missions, self.seating)
+        self.next_game += 1
+        self.num_games += 1
+        if self.num_games == len(self.games):
+            self.flush()
+
+    def flush_games(self):
+        with open(self.games_path, 'ab') as f:
+            self.games[:self.num_games].tofile(f)
+        self.num_games = 0
+
+    def flush_missions(self):
+        with open(self.missions_path, 'ab') as f:
+            self.missions[:self.num_missions].tofile(f)
+        self.num_missions = 0
+
+    def flush(self):
+        '''
+        writes all buffered records to the files
+        '''
+        self.flush_missions()
+        self.flush_games()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,139 @@
+'''
+Computes statistics of recorded tournaments (see recorder.py) without replaying any games.
+The record files are memory mapped and read in chunks, so a recording of millions of games
+is analysed in a single pass over the files with a bounded amount of memory.
+Run as
+    python replay.py <record_dir>
+to print the same results as a tournament, followed by the other statistics.
+'''
+
+from recorder import GAME_DTYPE, MISSION_DTYPE, MAX_PLAYERS
+from online_stats import new_stats
+from tournament import print_results
+import json
+import os
+import sys
+import numpy as np
+
+
+def shard_dirs(record_dir):
+    '''
+    returns the directories of recorded games in record_dir,
+    which is either a directory written by one GameRecorder or a directory of them (such as shard-* directories)
+    '''
+    if os.path.exists(os.path.join(record_dir, 'games.bin')):
+        return [record_dir]
+    subdirs = [os.path.join(record_dir, d) for d in sorted(os.listdir(record_dir))]
+    return [d for d in subdirs if os.path.exists(os.path.join(d, 'games.bin'))]
+
+
+def load_roster(record_dir):
+    '''
+    returns the names of the roster of the recorded games
+    '''
+    with open(os.path.join(shard_dirs(record_dir)[0], 'roster.json')) as f:
+        return json.load(f)['roster']
+
+
+def open_records(path, dtype):
+    '''
+    memory maps a file of records, read only
+    '''
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def rate(wins, games):
+    '''
+    returns wins / games, with nan where there were no games
+    '''
+    return np.divide(wins, games, out=np.full(np.shape(wins), np.nan), where=np.asarray(games) > 0)
+
+
+def analyse(record_dir, chunk_size=1 << 20):
+    '''
+    returns a dictionary of statistics of all games recorded in record_dir:
+    - tournament_stats, the per agent win counts in the format of tournament.play_tournament
+    - total_rounds, the number of games
+    - spy_win_rate_by_seat, the win rate of spies in each seat
+    - approval_rate_by_leader, the fraction of teams proposed by each agent of the roster that were approved
+    - fail_rate_by_round, indexed by [number of players, round], the fraction of approved missions that failed
+    Rates are nan where there were no games or missions to count.
+    Trailing missions of a game a run stopped in, which has no game record, are ignored.
+    '''
+    roster = load_roster(record_dir)
+    num_agents = len(roster)
+    seats = np.arange(MAX_PLAYERS)
+
+    spy_games = np.zeros(num_agents, dtype=np.int64)
+    spy_wins = np.zeros(num_agents, dtype=np.int64)
+    resistance_games = np.zeros(num_agents, dtype=np.int64)
+    resistance_wins = np.zeros(num_agents, dtype=np.int64)
+    seat_spy_games = np.zeros(MAX_PLAYERS, dtype=np.int64)
+    seat_spy_wins = np.zeros(MAX_PLAYERS, dtype=np.int64)
+    proposals = np.zeros(num_agents, dtype=np.int64)
+    approvals = np.zeros(num_agents, dtype=np.int64)
+    missions_run = np.zeros((MAX_PLAYERS + 1, 5), dtype=np.int64)
+    missions_failed = np.zeros((MAX_PLAYERS + 1, 5), dtype=np.int64)
+    total_rounds = 0
+
+    for directory in shard_dirs(record_dir):
+        games = open_records(os.path.join(directory, 'games.bin'), GAME_DTYPE)
+        missions = open_records(os.path.join(directory, 'missions.bin'), MISSION_DTYPE)
+        total_rounds += len(games)
+
+        for start in range(0, len(games), chunk_size):
+            chunk = games[start:start + chunk_size]
+            seating = chunk['seating']
+            seated = seating >= 0
+            is_spy = (chunk['spies'][:, None].astype(np.int64) >> seats & 1).astype(bool)
+            spies_won = (chunk['missions_lost'] >= 3)[:, None]
+
+            spy_games += np.bincount(seating[is_spy], minlength=num_agents)
+            spy_wins += np.bincount(seating[is_spy & spies_won], minlength=num_agents)
+            resistance_games += np.bincount(seating[seated & ~is_spy], minlength=num_agents)
+            resistance_wins += np.bincount(seating[seated & ~is_spy & ~spies_won], minlength=num_agents)
+            seat_spy_games += is_spy.sum(axis=0)
+            seat_spy_wins += (is_spy & spies_won).sum(axis=0)
+
+        #missions of a game cut short by the end of a run have no game record, and are ignored
+        missions = missions[:np.searchsorted(missions['game'], len(games))]
+        for start in range(0, len(missions), chunk_size):
+            chunk = missions[start:start + chunk_size]
+            game = games[chunk['game']]
+            leader = game['seating'][np.arange(len(chunk)), chunk['leader']]
+            approved = chunk['fails'] >= 0
+
+            proposals += np.bincount(leader, minlength=num_agents)
+            approvals += np.bincount(leader[approved], minlength=num_agents)
+            np.add.at(missions_run, (game['num_players'][approved], chunk['round'][approved]), 1)
+            failed = approved & ~chunk['success']
+            np.add.at(missions_failed, (game['num_players'][failed], chunk['round'][failed]), 1)
+
+    tournament_stats = new_stats(num_agents)
+    for a in range(num_agents):
+        tournament_stats[a]['spy_games'] = int(spy_games[a])
+        tournament_stats[a]['spy_wins'] = int(spy_wins[a])
+        tournament_stats[a]['resistance_games'] = int(resistance_games[a])
+        tournament_stats[a]['resistance_wins'] = int(resistance_wins[a])
+
+    return {
+        'roster': roster,
+        'tournament_stats': tournament_stats,
+        'total_rounds': total_rounds,
+        'spy_win_rate_by_seat': rate(seat_spy_wins, seat_spy_games),
+        'approval_rate_by_leader': rate(approvals, proposals),
+        'fail_rate_by_round': rate(missions_failed, missions_run),
+    }
+
+
+if __name__ == '__main__':
+    analytics = analyse(sys.argv[1])
+    print_results(analytics['roster'], analytics['tournament_stats'], analytics['total_rounds'])
+    print('SPY WIN RATE BY SEAT:', analytics['spy_win_rate_by_seat'])
+    for a, name in enumerate(analytics['roster']):
+        print(f'APPROVAL RATE OF TEAMS PROPOSED BY {name} = {analytics["approval_rate_by_leader"][a]}')
+    for num_players in range(5, MAX_PLAYERS + 1):
+        if not np.isnan(analytics['fail_rate_by_round'][num_players]).all():
+            print(f'FAIL RATE BY ROUND WITH {num_players} PLAYERS:', analytics['fail_rate_by_round'][num_players])
@@ -0,0 +1,9 @@
+import os
+import sys
+
+#the modules of the repository are imported by their own names, as when run from the repository root,
+#and the decision tree modules import each other by their own names too (see decision_tree_agent.py).
+#pytest imports the repository's __init__.py, which needs both
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root)
+sys.path.append(os.path.join(root, 'decision_tree'))
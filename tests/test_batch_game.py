@@ -0,0 +1,37 @@
+from math import sqrt
+
+from batch_game import BatchGame, RandomBatchPolicy, play_batch_tournament
+from random_agent import RandomAgent
+from tournament import play_tournament
+import numpy as np
+import pytest
+
+
+def spy_win_rate(stats):
+    return sum(s['spy_wins'] for s in stats) / sum(s['spy_games'] for s in stats)
+
+
+@pytest.mark.parametrize('num_players', [5, 7, 10])
+def test_random_policy_matches_random_agent(num_players):
+    games, batch_games = 3000, 100000
+    agent_rate = spy_win_rate(play_tournament(lambda: [RandomAgent(name=str(i)) for i in range(num_players)],
+                                              games, master_seed=num_players))
+    batch_rate = spy_win_rate(play_batch_tournament([RandomBatchPolicy(name=str(i)) for i in range(num_players)],
+                                                    batch_games, seed=num_players))
+    #within 4 standard errors of the difference of the two spy win rates
+    p = batch_rate
+    assert abs(agent_rate - batch_rate) < 4 * sqrt(p * (1 - p) * (1 / games + 1 / batch_games))
+
+
+class RejectingPolicy(RandomBatchPolicy):
+    def vote(self, rng, teams, leaders, seats, spies):
+        return np.zeros(len(seats), dtype=bool)
+
+
+def test_five_rejected_proposals_lose_the_round():
+    game = BatchGame([RejectingPolicy(name=str(i)) for i in range(5)], 100, rng=0)
+    game.play_round(0)
+    assert (game.num_proposals[:, 0] == 5).all()
+    assert (game.fails[:, 0] == -1).all()
+    assert (game.missions_lost == 1).all()
+    assert (game.leader == 0).all()
@@ -0,0 +1,31 @@
+from itertools import combinations
+
+from mcts.belief import BayesianBelief, OpponentModel
+import numpy as np
+
+
+def make_belief(model):
+    #player 0 of a 5 player game, with 2 spies among the others
+    worlds = [sum(1 << p for p in spies) for spies in combinations(range(1, 5), 2)]
+    return BayesianBelief(worlds, 5, 0, model)
+
+
+def test_contradicted_model_falls_back_to_legal_worlds():
+    #leaders always propose a team with a spy on it, so a team of only the belief's holder is impossible in every world
+    belief = make_belief(OpponentModel(spy_leader_spy_team=1, resistance_leader_spy_team=1))
+    belief.observe_sabotages([1, 2], 1)
+    belief.observe_proposal([0], 1)
+
+    worlds, weights = belief.live()
+    assert sorted(worlds) == sorted(w for w in belief.worlds.tolist() if w & 0b110)
+    assert weights == [1.0] * len(worlds)
+    probabilities = belief.probabilities()
+    assert not np.isnan(probabilities).any()
+    assert np.isclose(probabilities.sum(), 1)
+
+
+def test_sabotages_still_rule_out_worlds():
+    belief = make_belief(OpponentModel())
+    belief.observe_sabotages([1, 2], 2)
+    worlds, _ = belief.live()
+    assert worlds == [0b110]
@@ -0,0 +1,54 @@
+import copy
+
+from mcts.array_tree import ArrayTree
+from mcts.monte_high_bf import NodeTree, SimultaneousMoveNode, TranspositionTable, ResistanceState, StateNames, to_mask
+
+
+def voting_state():
+    #5 players with spies 1 and 2 vote on the team of players 0 and 1, proposed by player 0
+    state = ResistanceState(5, to_mask([1, 2]), 0, 0, StateNames.SELECTION, 0, 0)
+    team, = [a for a in state.get_moves() if a.value == to_mask([0, 1])]
+    state.make_move(team)
+    return state
+
+
+def prefer(node, votes_for):
+    #makes DUCT choose a vote for the team for exactly the players in votes_for
+    for p in node.player:
+        approve, reject = node.player_actions[p]
+        approve.visits = reject.visits = 1
+        (approve if p in votes_for else reject).reward = 1
+
+
+def test_rejected_votes_share_the_next_state():
+    state = voting_state()
+    root = SimultaneousMoveNode(state.player)
+    tree = NodeTree(root, TranspositionTable(100))
+    moves = state.get_moves()
+
+    prefer(root, [0])
+    first_state = copy.copy(state)
+    first = tree.ucb_selection(root, moves, 0.7, first_state)
+    prefer(root, [1])
+    second_state = copy.copy(state)
+    second = tree.ucb_selection(root, moves, 0.7, second_state)
+
+    #both teams are rejected, so both votes lead to the next leader's selection
+    assert first.action != second.action
+    assert first_state.key() == second_state.key()
+    assert tree.table.get(first_state.key()) is first
+    assert second.children is first.children
+    assert len(root.children) == 2
+
+
+def test_array_tree_makes_joint_actions_lazily():
+    state = voting_state()
+    tree = ArrayTree(state.player)
+    moves = state.get_moves()
+    assert tree.unexplored_actions(tree.root, moves) == []
+
+    #every choice is untried, so every player first votes for the team
+    child = tree.ucb_selection(tree.root, moves, 0.7, state)
+    assert tree.action(child).value == to_mask(range(5))
+    assert state.state_name == StateNames.SABOTAGE
+    assert tree.size == 2
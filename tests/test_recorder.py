@@ -0,0 +1,38 @@
+from random_agent import RandomAgent
+from recorder import GameRecorder, GAME_DTYPE, MISSION_DTYPE
+from replay import analyse
+from tournament import play_game, play_tournament
+import numpy as np
+
+
+def make_agents():
+    return [RandomAgent(name=str(i)) for i in range(7)]
+
+
+def test_replay_matches_tournament(tmp_path):
+    stats = play_tournament(make_agents, 30, master_seed=1, record_dir=str(tmp_path))
+    analytics = analyse(str(tmp_path))
+    assert analytics['total_rounds'] == 30
+    assert analytics['tournament_stats'] == stats
+
+
+def test_trailing_missions_are_ignored_and_dropped(tmp_path):
+    directory = str(tmp_path / 'shard-0')
+    roster = make_agents()
+    with GameRecorder(directory, roster) as recorder:
+        for seed in range(5):
+            play_game(roster, seed, recorder)
+    expected = analyse(directory)
+
+    #a run stopped mid game leaves missions with no game record
+    with GameRecorder(directory, roster) as recorder:
+        recorder.missions[:3] = (5, 0, 0, 0, 0b11, 0b111, 0, True)
+        recorder.num_missions = 3
+    np.testing.assert_equal(analyse(directory)['approval_rate_by_leader'], expected['approval_rate_by_leader'])
+
+    with GameRecorder(directory, roster) as recorder:
+        play_game(roster, 5, recorder)
+    games = np.fromfile(str(tmp_path / 'shard-0' / 'games.bin'), dtype=GAME_DTYPE)
+    missions = np.fromfile(str(tmp_path / 'shard-0' / 'missions.bin'), dtype=MISSION_DTYPE)
+    assert len(games) == 6
+    assert np.bincount(missions['game']).tolist() == games['num_missions'].tolist()
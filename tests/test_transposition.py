@@ -0,0 +1,20 @@
+from mcts.monte_high_bf import TranspositionTable
+
+
+def test_evicts_least_recently_used():
+    table = TranspositionTable(3)
+    for key in 'abc':
+        table.put(key, key.upper())
+    assert table.get('a') == 'A'
+    table.put('d', 'D')
+    assert len(table) == 3
+    assert table.get('b') is None
+    assert list(table.nodes) == ['c', 'a', 'd']
+
+
+def test_never_exceeds_capacity():
+    table = TranspositionTable(5)
+    for i in range(100):
+        table.put(i % 17, i)
+        table.get((i * 7) % 17)
+        assert len(table) <= 5
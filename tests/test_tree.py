@@ -0,0 +1,46 @@
+import json
+import random
+
+from model import States
+from tree import Tree, TreeBatch
+
+
+def random_state(rng):
+    num_player = rng.randrange(5, 11)
+    spys = rng.sample(range(num_player), 2)
+    state = States(rng.random() < 0.5, rng.randrange(num_player), num_player, spys)
+    state.distrust[:] = [rng.random() for _ in range(num_player)]
+    state.current_mission = rng.sample(range(num_player), rng.randrange(2, 6))
+    state.update_proposer(rng.randrange(num_player))
+    state.current_required_fails = rng.choice([1, 2])
+    state.no_reject = rng.randrange(5)
+    state.no_fail = rng.randrange(3)
+    state.no_success = rng.randrange(3)
+    return state
+
+
+def test_tree_batch_matches_tree_evaluate():
+    rng = random.Random(0)
+    tree = Tree(rng)
+    for kind in ['PROPOSE', 'VOTE', 'BETRAY']:
+        compiled = [tree.compile_tree(tree.generate_tree(kind)) for _ in range(20)]
+        batch = TreeBatch(compiled)
+        for _ in range(200):
+            state = random_state(rng)
+            features = [func(state) for func in tree.feature_funcs]
+            assert batch.evaluate(features) == [tree.evaluate(c, state) for c in compiled]
+
+
+def test_tree_json_round_trip_keeps_decisions():
+    rng = random.Random(1)
+    tree = Tree(rng)
+    for kind in ['PROPOSE', 'VOTE', 'BETRAY']:
+        for _ in range(50):
+            original = tree.generate_tree(kind)
+            #saved as train.py saves tree.json, and read back with tree_from_json
+            reloaded = tree.tree_from_json(json.loads(json.dumps(original, indent=4)))
+            compiled, compiled_reloaded = tree.compile_tree(original), tree.compile_tree(reloaded)
+            for _ in range(20):
+                state = random_state(rng)
+                assert tree.evaluate(compiled_reloaded, state) == tree.evaluate(compiled, state)
+                assert tree.traverse_tree(reloaded, state) == tree.traverse_tree(original, state)
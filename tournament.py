@@ -0,0 +1,174 @@
+'''
+Runs many games of The Resistance between a fixed roster of agents and keeps
+per-agent win statistics. Games can be sharded across worker processes; every game
+is seeded from a master seed so a sharded run gives the same results as a serial one.
+A tournament can also stop early, once the win rates are known to a target precision (see online_stats.py).
+'''
+
+from game import Game
+from recorder import GameRecorder
+from online_stats import OnlineStats, new_stats
+from profiler import Profiler
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+import os
+import random
+
+
+def game_seeds(master_seed, total_rounds):
+    '''
+    returns the list of per game seeds drawn from the master seed.
+    the seed of game i only depends on the master seed and i, not on how games are sharded
+    '''
+    master = random.Random(master_seed)
+    return [master.getrandbits(32) for _ in range(total_rounds)]
+
+
+def play_game(roster, seed, recorder=None, profiler=None):
+    '''
+    plays a single seeded game between the agents in roster
+    and returns the game
+    '''
+    game = Game(roster, random.Random(seed), recorder, profiler)
+    if recorder is not None:
+        recorder.start_game(game, seating(roster, game))
+    game.play()
+    return game
+
+
+def replay_game(make_agents, seed):
+    '''
+    replays the game with the given seed on a fresh roster and returns it,
+    e.g. to inspect a single game of a long tournament without replaying the others.
+    Games with time limited agents (such as Monte) only replay exactly if the agent's search is
+    limited by iterations rather than time.
+    '''
+    return play_game(make_agents(), seed)
+
+
+def seating(roster, game):
+    '''
+    returns the index in the roster of the agent in each seat of game.
+    Game shuffles its agents, so seats are mapped back to their index in the roster.
+    '''
+    return [roster.index(agent) for agent in game.agents]
+
+
+def record_game(stats, roster, game):
+    '''
+    adds the outcome of game to stats
+    '''
+    spies_won = game.missions_lost >= 3
+    for seat, a in enumerate(seating(roster, game)):
+        if seat in game.spies:
+            stats[a]['spy_games'] += 1
+            if spies_won:
+                stats[a]['spy_wins'] += 1
+        else:
+            stats[a]['resistance_games'] += 1
+            if not spies_won:
+                stats[a]['resistance_wins'] += 1
+
+
+def play_games(roster, seeds, recorder=None, profiler=None):
+    '''
+    plays one game per seed with the given roster and returns the tournament_stats for those games
+    '''
+    stats = new_stats(len(roster))
+    for seed in seeds:
+        record_game(stats, roster, play_game(roster, seed, recorder, profiler))
+    return stats
+
+
+def print_results(agents, tournament_stats, total_rounds):
+    '''
+    prints the win rates of each agent of the roster, where agents are the agents or their names
+    '''
+    print('--------RESULTS----------')
+    for a in range(len(agents)):
+        s = str(agents[a]) + ':\n'
+        if tournament_stats[a]["spy_games"]:
+            s += f'SPY WIN RATE = {tournament_stats[a]["spy_wins"] / tournament_stats[a]["spy_games"]} | '
+        if tournament_stats[a]["resistance_games"]:
+            s += f'RESISTANCE WIN RATE = {tournament_stats[a]["resistance_wins"] / tournament_stats[a]["resistance_games"]} | '
+        s += f'OVERALL WIN RATE = {(tournament_stats[a]["resistance_wins"] + tournament_stats[a]["spy_wins"]) / total_rounds}'
+        s += '\n' + '-' * 100
+        print(s)
+
+
+#roster of agents owned by a worker process, built once by _init_worker, the recorder of its games
+#and whether its games are profiled
+_worker_roster = None
+_worker_recorder = None
+_worker_profile = False
+
+def _init_worker(make_agents, record_dir, profile):
+    global _worker_roster, _worker_recorder, _worker_profile
+    _worker_roster = make_agents()
+    if record_dir is not None:
+        _worker_recorder = GameRecorder(os.path.join(record_dir, 'shard-' + str(os.getpid())), _worker_roster)
+    _worker_profile = profile
+
+
+def _play_shard(seeds):
+    '''
+    returns the tournament_stats of the shard, and a Profiler of its games if they are profiled
+    '''
+    profiler = Profiler() if _worker_profile else None
+    stats = play_games(_worker_roster, seeds, _worker_recorder, profiler)
+    if _worker_recorder is not None:
+        _worker_recorder.flush()
+    return stats, profiler
+
+
+def play_tournament(make_agents, total_rounds, master_seed=0, num_workers=1, shard_size=50, record_dir=None,
+                    target_width=None, min_rounds=100, profiler=None):
+    '''
+    plays total_rounds games between the agents returned by make_agents and returns the tournament_stats.
+    make_agents is called once per worker process, so it must be a picklable (module level) function,
+    and agents should not carry state between games if results are to be reproducible.
+    With num_workers > 1 games are sent to a process pool in shards of shard_size games,
+    and the per shard stats are merged at the end.
+    If record_dir is given every game is recorded (see recorder.py) into a shard-* directory inside it,
+    one for each process that plays games.
+    If target_width is given total_rounds is the most games played: the tournament stops once at least
+    min_rounds games are played and every win rate's 95% Wilson interval is narrower than target_width,
+    or the agents' overall win rates are separated (see OnlineStats). Intervals are checked every shard_size
+    games, and with num_workers > 1 the games played depend on the order shards finish in,
+    so early stopping is only reproducible when serial. Shards still being played when a parallel
+    tournament stops are played to the end but not counted; if games are recorded, their games
+    are in the recording too.
+    The number of games played is stats[0]['spy_games'] + stats[0]['resistance_games'].
+    If profiler (a profiler.Profiler) is given, the time agents take in each of their callbacks
+    is added to it, merged over all workers.
+    '''
+    seeds = game_seeds(master_seed, total_rounds)
+    if num_workers <= 1:
+        roster = make_agents()
+        recorder = None if record_dir is None else GameRecorder(os.path.join(record_dir, 'shard-0'), roster)
+        online = OnlineStats(len(roster), target_width, min_rounds)
+        for i, seed in enumerate(tqdm(seeds)):
+            record_game(online.stats, roster, play_game(roster, seed, recorder, profiler))
+            if target_width is not None and (i + 1) % shard_size == 0 and online.done():
+                break
+        if recorder is not None:
+            recorder.close()
+        return online.stats
+
+    shards = [seeds[i:i + shard_size] for i in range(0, total_rounds, shard_size)]
+    online = None
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(make_agents, record_dir, profiler is not None)) as executor:
+        futures = [executor.submit(_play_shard, shard) for shard in shards]
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            shard_stats, shard_profiler = future.result()
+            if profiler is not None:
+                profiler.merge(shard_profiler)
+            if online is None:
+                online = OnlineStats(len(shard_stats), target_width, min_rounds)
+            online.merge(shard_stats)
+            if target_width is not None and online.done():
+                #shards not yet started are cancelled, and those already running are waited for,
+                #so no worker is still writing records once the tournament returns, but not counted
+                executor.shutdown(wait=True, cancel_futures=True)
+                break
+    return online.stats